@@ -2,23 +2,53 @@
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.routing import Mount, APIRoute
-from fastapi.staticfiles import StaticFiles
-from starlette.middleware.sessions import SessionMiddleware
-from api.app import router, templates, root
+from anyio import to_thread
+from api.app import router, pages, root, note_model
+from api.config import SEARCH_ENGINE, STATIC_DIR, METRICS_ENABLED, QUERY_PROFILER
 from api.routers.user_api import router as user_router
 from api.routers.note_api import router as note_router
-from api.database import create_database, create_tables, drop_db
+from api.database import engine, drop_db
+from api.migrations import run_migrations
+from api.utils.images import shutdown_executor
+from api.utils.assets import PrecompressedStaticFiles, static_assets
+from api.middleware.compression import CompressionMiddleware
+from api.middleware.sessions import ServerSessionMiddleware
+from api.middleware.metrics import MetricsMiddleware
+from api.middleware.profiler import QueryProfilerMiddleware
+from api.middleware.uploads import UploadLimitMiddleware
+from api.utils.passwords import password_hasher
+from api.utils.session_store import session_store
+from api.utils.metrics import instrument_engine
+from api.utils.profiler import query_profiler
 
 
 routes=[
-    Mount("/static", StaticFiles(directory="static"), name="static"),
+    Mount(
+        "/static",
+        PrecompressedStaticFiles(directory=STATIC_DIR, assets=static_assets),
+        name="static"
+    ),
     # APIRoute("/", endpoint=root, methods=["GET"]),
 ]
 
 app = FastAPI(routes=routes)
 
+# Opt-in SQL profiling of requests, inside the session middleware to check the caller
+if QUERY_PROFILER != "off":
+    app.add_middleware(QueryProfilerMiddleware)
+    query_profiler.instrument(engine)
+
 # Session middleware configuration
-app.add_middleware(SessionMiddleware, secret_key="mysecretkey2024")
+app.add_middleware(ServerSessionMiddleware, store=session_store)
+app.add_middleware(CompressionMiddleware)
+
+# Upload bodies are capped before they are parsed
+app.add_middleware(UploadLimitMiddleware)
+
+# Request and query metrics, outermost so the latency covers every other middleware
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine)
 
 app.include_router(router)
 app.include_router(user_router)
@@ -29,15 +59,23 @@ app.include_router(note_router)
 async def before_first_request():
     """This function is called when the application is Starting down"""
     print("Starting app")
-    create_database()
-    create_tables()
+    print(f"Static assets built: {await to_thread.run_sync(static_assets.build)} files")
+    pages.clear()
+    if not await run_migrations():
+        print("Database schema is up to date")
+    if SEARCH_ENGINE == "memory":
+        print(f"Search index built with {await note_model.build_search_index()} notes")
     print("Application startup complete")
 
 @app.on_event("shutdown")
 async def before_close_app():
     """This function is called when the application is shutting down"""
     print("Closing app")
-    # drop_db()
+    # await drop_db()
+    await engine.dispose()
+    shutdown_executor()
+    password_hasher.shutdown()
+    session_store.close()
     print("Application shutdown complete")
 
 
@@ -45,12 +83,11 @@ async def before_close_app():
 @app.exception_handler(HTTPException)
 async def not_found_exception_handler(req: Request, exc: HTTPException):
     """called when an HTTPException is raised"""
-    return templates.TemplateResponse(
-        request=req,
+    return pages.response(
         name="error_page.html",
         context={
             "error_code": exc.status_code,
-            "error_message": exc.detail or "Something went wrong",
+            "error_message": str(exc.detail or "Something went wrong"),
             "error_detail": "Please contact support if the issue persists."
         },
         status_code=exc.status_code
@@ -1,13 +1,22 @@
 """app.py"""
 
 from typing import Union
-from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Request, Depends
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from api.settings import SessionHandler
+from api.utils.session import get_session_manager, require_admin
+from api.utils.session_store import session_store
+from api.database import get_db, get_pool_stats
 from api.models.users import User
 from api.models.notes import Note
+from api.utils.assets import static_assets
+from api.utils.page_cache import PageCache
+from api.middleware.compression import compression_stats
+from api.utils.passwords import password_hasher
+from api.utils.metrics import metrics
+from api.utils.profiler import query_profiler
 
 
 router = APIRouter()
@@ -15,6 +24,8 @@ user_model = User()
 note_model = Note()
 
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["static_url"] = static_assets.url
+pages = PageCache(templates)
 
 
 class Test(BaseModel):
@@ -31,24 +42,80 @@ async def root():
     }
 
 
-@router.get("/home")
+@router.get("/home", dependencies=[Depends(get_db)])
 @SessionHandler(action="require_login")
 async def home(req: Request):
     """Home Page"""
-    current_user = user_model.get_user_by_session_id(
-        req.session.get("session_id")
-    )
+    session = await get_session_manager(req)
+    current_user = session.user or await user_model.get_user_by_session_id(session.session_id)
     return {
         "message": f"Welcome {current_user.username} in Home"
     }
 
 
+@router.get(
+    "/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_admin)]
+)
+async def metrics_export():
+    """Request and database metrics in the Prometheus text format"""
+    return PlainTextResponse(
+        metrics.export(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@router.get("/status/query-profiles", dependencies=[Depends(require_admin)])
+async def query_profiles_status():
+    """Statements, timings and possible N+1 patterns of the last profiled requests"""
+    return query_profiler.stats()
+
+
+@router.get("/status/db-pool", dependencies=[Depends(require_admin)])
+async def db_pool_status():
+    """Live connection pool statistics"""
+    return get_pool_stats()
+
+
+@router.get("/status/session-cache", dependencies=[Depends(require_admin)])
+async def session_cache_status():
+    """Hit, miss and eviction counters of the session -> user cache"""
+    return user_model.session_cache.stats()
+
+
+@router.get("/status/sessions", dependencies=[Depends(require_admin)])
+async def sessions_status():
+    """Live sessions and revocation counters of the server-side session store"""
+    return session_store.stats()
+
+
+@router.get("/status/note-cache", dependencies=[Depends(require_admin)])
+async def note_cache_status():
+    """Statistics of the note cache backend"""
+    return note_model.cache.stats()
+
+
+@router.get("/status/compression", dependencies=[Depends(require_admin)])
+async def compression_status():
+    """Response compression savings per route"""
+    return compression_stats.stats()
+
+
+@router.get("/status/page-cache", dependencies=[Depends(require_admin)])
+async def page_cache_status():
+    """Statistics of the rendered pages cache"""
+    return pages.stats()
+
+
+@router.get("/status/password-hasher", dependencies=[Depends(require_admin)])
+async def password_hasher_status():
+    """Password hashing pool usage and queue times"""
+    return password_hasher.stats()
+
+
 @router.get("/register", response_class=HTMLResponse)
 @SessionHandler(action="load_current_user")
 async def register(req: Request):
     """Register Page"""
-    return templates.TemplateResponse(
-        request = req,
+    return pages.response(
         name = "login_page.html",
         context = {
             "title": "Register Page",
@@ -61,8 +128,7 @@ async def register(req: Request):
 @SessionHandler(action="load_current_user")
 async def login(req: Request):
     """Login Page"""
-    return templates.TemplateResponse(
-        request = req,
+    return pages.response(
         name = "login_page.html",
         context = {
             "title": "Login Page",
@@ -0,0 +1,137 @@
+"""config.py"""
+
+from os import getenv
+
+USERNAME = getenv("DB_USERNAME", "root")
+PASSWORD = getenv("DB_PASSWORD", "Abdallah%402004")
+HOST = getenv("DB_HOST", "localhost")
+DATABASE = getenv("DB_NAME", "note_db")
+
+# Async driver URLs, e.g. "sqlite+aiosqlite:///./note_db.sqlite3" for local runs
+SERVER_URL = getenv("DATABASE_SERVER_URL", f"mysql+aiomysql://{USERNAME}:{PASSWORD}@{HOST}/")
+DATABASE_URL = getenv("DATABASE_URL", f"{SERVER_URL}{DATABASE}")
+
+# Connection pool, size it to the number of concurrent requests per worker
+DB_POOL_SIZE = int(getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Note search engine: "sql" (LIKE scan), "memory" (in-process inverted index)
+# or "fulltext" (MySQL FULLTEXT / SQLite FTS5 index)
+SEARCH_ENGINE = getenv("SEARCH_ENGINE", "sql").lower()
+
+# session_id -> user cache, used on every authenticated page view
+SESSION_CACHE_SIZE = int(getenv("SESSION_CACHE_SIZE", "1024"))
+SESSION_CACHE_TTL = float(getenv("SESSION_CACHE_TTL", "300"))
+
+# Note cache: "local" (in-process), "shared" (redis at NOTE_CACHE_URL) or "none"
+NOTE_CACHE_BACKEND = getenv("NOTE_CACHE_BACKEND", "local").lower()
+NOTE_CACHE_URL = getenv("NOTE_CACHE_URL", "redis://localhost:6379/0")
+NOTE_CACHE_MAX_BYTES = int(getenv("NOTE_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+NOTE_CACHE_TTL = float(getenv("NOTE_CACHE_TTL", "300"))
+
+# Largest number of operations accepted by POST /api/notes/batch
+NOTE_BATCH_MAX_SIZE = int(getenv("NOTE_BATCH_MAX_SIZE", "500"))
+
+# Rows fetched per round trip when streaming notes out of the database
+EXPORT_BATCH_SIZE = int(getenv("EXPORT_BATCH_SIZE", "1000"))
+
+# Notes inserted per statement by POST /api/notes/import, errors reported,
+# and the longest line or CSV record (in characters) buffered while parsing
+IMPORT_BATCH_SIZE = int(getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_ERRORS = int(getenv("IMPORT_MAX_ERRORS", "100"))
+IMPORT_MAX_RECORD_LENGTH = int(getenv("IMPORT_MAX_RECORD_LENGTH", "1048576"))
+
+# Profile image uploads are streamed to disk in chunks and capped in size
+UPLOAD_CHUNK_SIZE = int(getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+PROFILE_IMAGE_MAX_BYTES = int(getenv("PROFILE_IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# Square profile image variants (px) rendered at upload, and the worker processes
+# rendering them; needs Pillow, set PROFILE_IMAGE_SIZES="" to disable
+PROFILE_IMAGE_SIZES = tuple(
+    int(size) for size in getenv("PROFILE_IMAGE_SIZES", "32,64,256").split(",") if size.strip()
+)
+IMAGE_WORKERS = int(getenv("IMAGE_WORKERS", "2"))
+
+# In-memory cache of small profile images (total bytes, largest cached image)
+# and of the profile image metadata of the users (entries, seconds)
+IMAGE_CACHE_MAX_BYTES = int(getenv("IMAGE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+IMAGE_CACHE_ITEM_MAX_BYTES = int(getenv("IMAGE_CACHE_ITEM_MAX_BYTES", str(256 * 1024)))
+IMAGE_CACHE_SIZE = int(getenv("IMAGE_CACHE_SIZE", "1024"))
+IMAGE_CACHE_TTL = float(getenv("IMAGE_CACHE_TTL", "300"))
+
+# Static files are fingerprinted and precompressed into STATIC_BUILD_DIR at startup
+STATIC_DIR = getenv("STATIC_DIR", "static")
+STATIC_BUILD_DIR = getenv("STATIC_BUILD_DIR", "build/static")
+STATIC_COMPRESS_MIN_SIZE = int(getenv("STATIC_COMPRESS_MIN_SIZE", "1024"))
+
+# Response compression, encodings in order of preference ("br" needs brotli,
+# "zstd" needs zstandard), bodies smaller than COMPRESSION_MINIMUM_SIZE are sent as is
+COMPRESSION_ENCODINGS = tuple(
+    encoding.strip().lower()
+    for encoding in getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",") if encoding.strip()
+)
+COMPRESSION_MINIMUM_SIZE = int(getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_ZSTD_LEVEL = int(getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+
+# Rendered pages cache (entries, total bytes); TEMPLATES_AUTO_RELOAD=true (dev mode)
+# re-renders after template changes, compiled templates are kept in TEMPLATE_BYTECODE_DIR
+PAGE_CACHE_SIZE = int(getenv("PAGE_CACHE_SIZE", "256"))
+PAGE_CACHE_MAX_BYTES = int(getenv("PAGE_CACHE_MAX_BYTES", str(4 * 1024 * 1024)))
+TEMPLATES_AUTO_RELOAD = getenv("TEMPLATES_AUTO_RELOAD", "false").lower() in ("1", "true", "yes")
+TEMPLATE_BYTECODE_DIR = getenv("TEMPLATE_BYTECODE_DIR", "build/jinja")
+
+# Length of the content preview of summary note listings (view=summary)
+NOTE_PREVIEW_LENGTH = int(getenv("NOTE_PREVIEW_LENGTH", "120"))
+
+# Password hashing: "scrypt" or "pbkdf2_sha256" in PASSWORD_HASH_WORKERS threads,
+# at most PASSWORD_HASH_MAX_QUEUE calls wait for a thread (more get 503)
+PASSWORD_HASH_ALGORITHM = getenv("PASSWORD_HASH_ALGORITHM", "scrypt").lower()
+PASSWORD_HASH_WORKERS = int(getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+SCRYPT_N = int(getenv("SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(getenv("SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(getenv("PBKDF2_ITERATIONS", "600000"))
+
+# Server-side sessions: "memory" (sharded dict, one per process) or "sqlite" (file at
+# SESSION_STORE_PATH shared by the workers of a host); a session expires SESSION_TTL
+# seconds after its last change, the cookie only carries the random session key
+SESSION_BACKEND = getenv("SESSION_BACKEND", "memory").lower()
+SESSION_STORE_PATH = getenv("SESSION_STORE_PATH", "build/sessions.sqlite3")
+SESSION_TTL = int(getenv("SESSION_TTL", str(14 * 24 * 60 * 60)))
+SESSION_SHARDS = int(getenv("SESSION_SHARDS", "16"))
+SESSION_COOKIE = getenv("SESSION_COOKIE", "session")
+SESSION_COOKIE_SECURE = getenv("SESSION_COOKIE_SECURE", "false").lower() in ("1", "true", "yes")
+
+# Ids of the users allowed on the admin endpoints (/metrics, /status/*, other users'
+# sessions); scrapers without a session send "Authorization: Bearer <METRICS_TOKEN>"
+ADMIN_USER_IDS = frozenset(
+    int(user_id) for user_id in getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()
+)
+METRICS_TOKEN = getenv("METRICS_TOKEN", "")
+
+# Prometheus metrics at /metrics: request latency histogram buckets (seconds),
+# also used for the database query durations
+METRICS_ENABLED = getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_BUCKETS = tuple(sorted(
+    float(bucket) for bucket in getenv(
+        "METRICS_BUCKETS", "0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10"
+    ).split(",") if bucket.strip()
+))
+
+# Query profiler: "off", "header" (admin requests sending X-Query-Profile: 1) or "all";
+# profiled responses get a Server-Timing header, statement shapes repeated
+# QUERY_PROFILER_REPEAT_THRESHOLD times are logged as possible N+1 and statements
+# slower than QUERY_PROFILER_SLOW_MS are logged with their EXPLAIN plan. Bound
+# parameters (password hashes, session ids, ...) are only logged and kept with
+# QUERY_PROFILER_PARAMETERS=true
+QUERY_PROFILER = getenv("QUERY_PROFILER", "off").lower()
+QUERY_PROFILER_SLOW_MS = float(getenv("QUERY_PROFILER_SLOW_MS", "100"))
+QUERY_PROFILER_REPEAT_THRESHOLD = int(getenv("QUERY_PROFILER_REPEAT_THRESHOLD", "3"))
+QUERY_PROFILER_HISTORY = int(getenv("QUERY_PROFILER_HISTORY", "50"))
+QUERY_PROFILER_PARAMETERS = getenv("QUERY_PROFILER_PARAMETERS", "false").lower() in ("1", "true", "yes")
@@ -1,17 +1,26 @@
 """database.py"""
 
 from datetime import datetime
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 # from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine, Column, Integer, String, Text, text, DateTime
-
-USERNAME = "root"
-PASSWORD = "Abdallah%402004"
-HOST = "localhost"
-DATABASE = "note_db"
+from sqlalchemy import Column, Integer, String, Text, text, DateTime, Index, make_url
+from sqlalchemy.dialects.mysql import DATETIME
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql import table, column
+from api.config import DATABASE, DATABASE_URL, SERVER_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW,\
+    DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING
 
 # Base = declarative_base()
 
+# MySQL DATETIME drops the fractional seconds unless asked, and note ETags
+# are built from time_edition, so two edits within a second must differ
+Timestamp = DateTime().with_variant(DATETIME(fsp=6), "mysql")
+
+
 class Base(DeclarativeBase):
     """Base class for all models"""
 
@@ -30,6 +39,10 @@ class UserDb(Base):
     date_of_birth = Column(Text, default=None)
     profile_image = Column(Text, default=None)
 
+    __table_args__ = (
+        Index("ix_users_session_id", "session_id"),
+    )
+
 
 class NoteDb(Base):
     """This class represents the note table in the database."""
@@ -39,40 +52,174 @@ class NoteDb(Base):
     user_id = Column(Integer, nullable=False)
     title = Column(String(100))
     content = Column(Text, nullable=False)
-    time_created = Column(DateTime)
-    time_edition = Column(DateTime)
+    time_created = Column(Timestamp)
+    # a keyset column of the user listings, a NULL would never match a cursor
+    time_edition = Column(Timestamp, nullable=False)
+
+    __table_args__ = (
+        # per-user listings filter on user_id and page on (time_edition, id)
+        Index("ix_notes_user_id_time_edition_id", "user_id", "time_edition", "id"),
+    )
+
+
+class SchemaVersionDb(Base):
+    """This class represents the applied schema migrations."""
+    __tablename__ = 'schema_version'
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(100), nullable=False)
+    applied_at = Column(DateTime, default=datetime.now)
+
+
+# External content FTS5 table kept in sync with `notes` by triggers (SQLite only)
+notes_fts = table("notes_fts", column("rowid"), column("title"), column("content"))
+
+SQLITE_FULLTEXT_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5("
+    "title, content, content='notes', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN "
+    "INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE ON notes BEGIN "
+    "INSERT INTO notes_fts(notes_fts, rowid, title, content) "
+    "VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO notes_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END",
+)
+
+# MATCH needs an index over exactly the searched columns, so one per field
+MYSQL_FULLTEXT_INDEXES = {
+    "ft_notes_title": "title",
+    "ft_notes_content": "content",
+}
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that keeps track of the callers waiting for a connection"""
+    waiting = 0
+
+    def _do_get(self):
+        self.waiting += 1
+        try:
+            return super()._do_get()
+        finally:
+            self.waiting -= 1
+
 
+def pool_options(url: str) -> dict:
+    """Return the pool settings for the given database url"""
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
 
-engine_without_db = create_engine(f'mysql+mysqlconnector://{USERNAME}:{PASSWORD}@{HOST}/')
-engine = create_engine(f'mysql+mysqlconnector://{USERNAME}:{PASSWORD}@{HOST}/{DATABASE}')
+    return {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
 
-SessionLocal = sessionmaker(bind=engine)
 
-def create_database():
+engine = create_async_engine(DATABASE_URL, **pool_options(DATABASE_URL))
+
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+current_session: ContextVar[Optional[AsyncSession]] = ContextVar("current_session", default=None)
+
+def is_sqlite() -> bool:
+    """Check if the configured database is SQLite"""
+    return engine.dialect.name == "sqlite"
+
+async def create_database():
     """Creates the database schema."""
-    with engine_without_db.connect() as connection:
-        connection.execute(
-            text(f"CREATE DATABASE IF NOT EXISTS {DATABASE}")
-        )
-    print("Database 'note_db' created or already exists.")
+    if is_sqlite():
+        return
 
-def create_tables():
-    """Creates the tables in the database schema"""
-    Base.metadata.create_all(engine)
-    print("Tables created or already exist.")
+    engine_without_db = create_async_engine(SERVER_URL)
+    try:
+        async with engine_without_db.connect() as connection:
+            await connection.execute(
+                text(f"CREATE DATABASE IF NOT EXISTS {DATABASE}")
+            )
+    finally:
+        await engine_without_db.dispose()
+    print(f"Database '{DATABASE}' created or already exists.")
+
+async def create_fulltext_indexes(connection):
+    """Creates the full-text search indexes of the notes table"""
+    if connection.dialect.name == "sqlite":
+        exists = await connection.scalar(
+            text("SELECT 1 FROM sqlite_master WHERE name = 'notes_fts'")
+        )
+        for statement in SQLITE_FULLTEXT_DDL:
+            await connection.execute(text(statement))
+        if not exists:
+            await connection.execute(text("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')"))
+        return
+
+    existing = set((await connection.execute(
+        text(
+            "SELECT DISTINCT index_name FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'notes'"
+        )
+    )).scalars())
+    for name, field in MYSQL_FULLTEXT_INDEXES.items():
+        if name not in existing:
+            await connection.execute(text(f"CREATE FULLTEXT INDEX {name} ON notes ({field})"))
 
-def drop_db():
+async def drop_db():
     """Drops the database and all tables in it"""
-    with engine.connect() as connection:
-        connection.execute(
-            text(f"DROP DATABASE IF EXISTS {DATABASE}")
-        )
-    print("Database 'note_db' dropped.")
+    if is_sqlite():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
+    else:
+        async with engine.begin() as connection:
+            await connection.execute(
+                text(f"DROP DATABASE IF EXISTS {DATABASE}")
+            )
+    print(f"Database '{DATABASE}' dropped.")
+
+@asynccontextmanager
+async def session_scope():
+    """Open a new session and bind it to the current context"""
+    async with SessionLocal() as db:
+        token = current_session.set(db)
+        try:
+            yield db
+        finally:
+            current_session.reset(token)
+
+@asynccontextmanager
+async def use_session():
+    """Use the session bound to the current request, or open a short-lived one"""
+    db = current_session.get()
+    if db is not None:
+        yield db
+        return
 
-def get_db():
-    """Return a new session"""
-    db = SessionLocal()
-    try:
+    async with session_scope() as db:
         yield db
-    finally:
-        db.close()
+
+async def get_db():
+    """Return a new request-scoped session"""
+    async with session_scope() as db:
+        yield db
+
+def get_pool_stats() -> dict:
+    """Return live statistics of the connection pool"""
+    pool = engine.pool
+    if not isinstance(pool, AsyncAdaptedQueuePool):
+        return {"pool": type(pool).__name__}
+
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "waiting": getattr(pool, "waiting", 0),
+    }
@@ -0,0 +1,158 @@
+"""compression.py"""
+
+import gzip
+from typing import Callable, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from api.config import COMPRESSION_ENCODINGS, COMPRESSION_MINIMUM_SIZE, COMPRESSION_GZIP_LEVEL,\
+    COMPRESSION_BROTLI_QUALITY, COMPRESSION_ZSTD_LEVEL
+from api.utils.http_cache import accepted_encodings
+from api.utils.metrics import route_label
+
+try:
+    import brotli
+except ImportError:  # brotli and zstandard are optional, gzip is always available
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml")
+COMPRESSIBLE_SUFFIXES = ("+json", "+xml", "/svg+xml")
+
+
+def available_compressors() -> dict[str, Callable[[bytes], bytes]]:
+    """Content-Encoding -> compressor of the installed codecs, in COMPRESSION_ENCODINGS order"""
+    compressors = {
+        "gzip": lambda body: gzip.compress(body, COMPRESSION_GZIP_LEVEL, mtime=0),
+    }
+    if brotli is not None:
+        compressors["br"] = lambda body: brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    if zstandard is not None:
+        compressors["zstd"] = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress
+    return {
+        encoding: compressors[encoding]
+        for encoding in COMPRESSION_ENCODINGS if encoding in compressors
+    }
+
+
+def is_compressible(content_type: str) -> bool:
+    """Check if a media type is text that is worth compressing"""
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith(COMPRESSIBLE_TYPES) or media_type.endswith(COMPRESSIBLE_SUFFIXES)
+
+
+class CompressionStats():
+    """Per route counters of the compressed responses and the bytes they saved"""
+    def __init__(self):
+        self.routes: dict[str, dict[str, int]] = {}
+
+    def record(self, route: str, encoding: str, size: int, compressed_size: int):
+        """Count one compressed response"""
+        counters = self.routes.setdefault(
+            route, {"responses": 0, "bytes_in": 0, "bytes_out": 0}
+        )
+        counters["responses"] += 1
+        counters["bytes_in"] += size
+        counters["bytes_out"] += compressed_size
+        counters[encoding] = counters.get(encoding, 0) + 1
+
+    def stats(self) -> dict:
+        """Return the counters with the bytes saved, biggest savings first"""
+        routes = {
+            route: {**counters, "bytes_saved": counters["bytes_in"] - counters["bytes_out"]}
+            for route, counters in self.routes.items()
+        }
+        return {
+            "encodings": list(available_compressors()),
+            "minimum_size": COMPRESSION_MINIMUM_SIZE,
+            "bytes_saved": sum(counters["bytes_saved"] for counters in routes.values()),
+            "routes": dict(sorted(routes.items(), key=lambda item: -item[1]["bytes_saved"])),
+        }
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware():
+    """
+    Compress text responses with the best encoding the client accepts.
+
+    Only responses sent in a single body message are compressed: streaming
+    responses, responses that already have a Content-Encoding or are marked
+    `Cache-Control: no-transform`, partial content and bodies under
+    `minimum_size` bytes go out untouched.
+    """
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compressors = available_compressors()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        encoding = next((name for name in self.compressors if name in accepted), None)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start = message
+                headers = Headers(raw=message["headers"])
+                passthrough = (
+                    message["status"] in (204, 206, 304)
+                    or "content-encoding" in headers
+                    or "no-transform" in headers.get("cache-control", "").lower()
+                    or not is_compressible(headers.get("content-type", ""))
+                )
+                if passthrough:
+                    await send(start)
+                return
+
+            if message["type"] != "http.response.body":
+                # e.g. http.response.pathsend, the held start has to go out first
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            passthrough = True
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                await send(start)
+                await send(message)
+                return
+
+            compressed = self.compressors[encoding](body)
+            if len(compressed) >= len(body):
+                await send(start)
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            if "etag" in headers and not headers["etag"].startswith("W/"):
+                # the compressed bytes differ from the identity representation
+                headers["ETag"] = f"W/{headers['etag']}"
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed, "more_body": False})
+
+            compression_stats.record(route_label(scope), encoding, len(body), len(compressed))
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,45 @@
+"""metrics.py"""
+
+from time import perf_counter
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from api.utils.metrics import metrics, current_scope, route_label
+
+
+class MetricsMiddleware():
+    """
+    Record the status counts, errors and latency of every request, labelled
+    with the template of the route that served it.
+
+    The request scope is published in `current_scope`: the router fills in
+    its route, so the queries and the in-flight gauge are labelled with it.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        started_at = perf_counter()
+        token = current_scope.set(scope)
+        metrics.active[id(scope)] = (method, scope)
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            del metrics.active[id(scope)]
+            current_scope.reset(token)
+            route = route_label(scope)
+            metrics.request_duration.observe(perf_counter() - started_at, method, route)
+            metrics.requests.inc(method, route, str(status))
+            if status >= 500:
+                metrics.request_errors.inc(method, route)
@@ -0,0 +1,54 @@
+"""profiler.py"""
+
+from time import perf_counter
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from api.config import QUERY_PROFILER
+from api.utils.profiler import QueryProfile, current_profile, query_profiler
+from api.utils.session import is_admin
+
+
+class QueryProfilerMiddleware():
+    """
+    Profile the SQL statements of a request: every request with `mode="all"`,
+    only those of admins sending `X-Query-Profile: 1` with `mode="header"`;
+    it reads the session so it runs inside the session middleware.
+
+    The response gets a Server-Timing header with the database time of the
+    statements run before it started; the profile is analysed once the
+    response is sent.
+    """
+    def __init__(self, app: ASGIApp, mode: str = QUERY_PROFILER):
+        self.app = app
+        self.mode = mode
+
+    def wanted(self, scope: Scope) -> bool:
+        """Check if a request is profiled"""
+        if self.mode == "all":
+            return True
+        return self.mode == "header" and Headers(scope=scope).get("x-query-profile") == "1" \
+            and is_admin(scope.get("session", {}))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile(scope["method"], scope["path"])
+        token = current_profile.set(profile)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Server-Timing",
+                    f"{profile.server_timing()}, app;dur={(perf_counter() - profile.started_at) * 1000:.2f}"
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            profile.duration = perf_counter() - profile.started_at
+            await query_profiler.finish(profile)
@@ -0,0 +1,70 @@
+"""sessions.py"""
+
+from secrets import token_urlsafe
+from starlette.datastructures import MutableHeaders
+from starlette.middleware.sessions import Session
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from api.config import SESSION_COOKIE, SESSION_TTL, SESSION_COOKIE_SECURE
+
+EXPIRED = "expires=Thu, 01 Jan 1970 00:00:00 GMT; "
+
+
+class ServerSessionMiddleware():
+    """
+    Drop-in replacement of starlette's SessionMiddleware keeping the session
+    data in a server-side `store`: the cookie only holds a random session key.
+
+    `request.session` works as before; the data is saved when it changed,
+    under a new key when it is new or the logged in user changed (so a key
+    set before the login is never reused), and removed when it was cleared.
+    """
+    def __init__(
+        self,
+        app: ASGIApp,
+        store,
+        session_cookie: str = SESSION_COOKIE,
+        max_age: int = SESSION_TTL,
+        https_only: bool = SESSION_COOKIE_SECURE
+    ):
+        self.app = app
+        self.store = store
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.security_flags = "httponly; samesite=lax" + ("; secure" if https_only else "")
+
+    def cookie(self, value: str, expires: str) -> str:
+        """Set-Cookie header value of the session cookie"""
+        return f"{self.session_cookie}={value}; path=/; {expires}{self.security_flags}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        key = HTTPConnection(scope).cookies.get(self.session_cookie)
+        data = await self.store.get(key) if key else None
+        scope["session"] = Session(data or {})
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                session: Session = scope["session"]
+                headers = MutableHeaders(scope=message)
+                if session.accessed:
+                    headers.add_vary_header("Cookie")
+                if session.modified and session:
+                    new_key = key
+                    if data is None or session.get("id") != data.get("id"):
+                        if data is not None:
+                            await self.store.delete(key)
+                        new_key = token_urlsafe(32)
+                    await self.store.set(new_key, dict(session))
+                    headers.append("Set-Cookie", self.cookie(new_key, f"Max-Age={self.max_age}; "))
+                elif key and (data is None or session.modified):
+                    # cleared, or the key is unknown (expired or revoked)
+                    if data is not None:
+                        await self.store.delete(key)
+                    headers.append("Set-Cookie", self.cookie("null", EXPIRED))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,60 @@
+"""uploads.py"""
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from api.config import PROFILE_IMAGE_MAX_BYTES
+
+# multipart boundaries and part headers sent around the file
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class UploadLimitMiddleware():
+    """
+    Cap the request body of the uploads (POST to a path ending with one of
+    `suffixes`) before it is parsed: a Content-Length over the limit is
+    answered 413 without reading the body, and a body growing past it while
+    being received stops the multipart parsing with a 413, so Starlette
+    never spools more than the limit to disk.
+
+    The limit covers the whole multipart body; the size of the file itself
+    is checked again while it is saved.
+    """
+    def __init__(
+        self, app: ASGIApp, max_bytes: int = PROFILE_IMAGE_MAX_BYTES + MULTIPART_OVERHEAD,
+        suffixes: tuple[str, ...] = ("/profile-image",)
+    ):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.suffixes = suffixes
+
+    def limited(self, scope: Scope) -> bool:
+        """Check if a request is an upload"""
+        return scope["type"] == "http" and scope["method"] == "POST" \
+            and scope["path"].endswith(self.suffixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.limited(scope):
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body is larger than {self.max_bytes} bytes"
+        length = Headers(scope=scope).get("content-length", "")
+        if length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse({"detail": detail}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_limited() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, receive_limited, send)
@@ -0,0 +1,116 @@
+"""migrations.py"""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable
+from sqlalchemy import select, inspect, text, update, func
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncConnection
+from api.config import SEARCH_ENGINE
+from api.database import engine, Base, UserDb, NoteDb, SchemaVersionDb, create_database,\
+    create_fulltext_indexes
+
+
+@dataclass(frozen=True)
+class Migration():
+    """A versioned schema change, applied once and recorded in `schema_version`"""
+    version: int
+    name: str
+    upgrade: Callable[[AsyncConnection], Awaitable[None]]
+    enabled: Callable[[], bool] = field(default=lambda: True)
+
+
+async def create_initial_tables(connection: AsyncConnection):
+    """Create the users and notes tables"""
+    await connection.run_sync(
+        Base.metadata.create_all, tables=[UserDb.__table__, NoteDb.__table__]
+    )
+
+
+async def create_secondary_indexes(connection: AsyncConnection):
+    """Create the indexes used by session lookups and per-user note listings"""
+    def create_missing(sync_connection):
+        inspector = inspect(sync_connection)
+        for table in (UserDb.__table__, NoteDb.__table__):
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(sync_connection)
+
+    await connection.run_sync(create_missing)
+
+
+async def note_timestamps_microseconds(connection: AsyncConnection):
+    """Keep the fractional seconds of the note timestamps on MySQL"""
+    if connection.dialect.name == "mysql":
+        await connection.execute(text(
+            "ALTER TABLE notes MODIFY time_created DATETIME(6) NULL, "
+            "MODIFY time_edition DATETIME(6) NULL"
+        ))
+
+
+async def note_edition_not_null(connection: AsyncConnection):
+    """
+    Fill in the missing note edition times (with the creation time) and make
+    the column NOT NULL, user pages seek on (time_edition, id) and a NULL
+    never compares. SQLite cannot alter a column, its existing tables only
+    get the backfill.
+    """
+    await connection.execute(
+        update(NoteDb.__table__).where(NoteDb.time_edition.is_(None))
+        .values(time_edition=func.coalesce(NoteDb.time_created, datetime.utcnow()))
+    )
+    if connection.dialect.name == "mysql":
+        await connection.execute(text("ALTER TABLE notes MODIFY time_edition DATETIME(6) NOT NULL"))
+
+
+MIGRATIONS = [
+    Migration(1, "initial tables", create_initial_tables),
+    Migration(2, "secondary indexes", create_secondary_indexes),
+    Migration(
+        3, "full-text search indexes", create_fulltext_indexes,
+        enabled=lambda: SEARCH_ENGINE == "fulltext"
+    ),
+    Migration(4, "sub-second note timestamps", note_timestamps_microseconds),
+    Migration(5, "non-null note edition time", note_edition_not_null),
+]
+
+
+async def applied_versions() -> set[int]:
+    """Return the versions recorded in `schema_version`"""
+    async with engine.connect() as connection:
+        return set((await connection.scalars(select(SchemaVersionDb.version))).all())
+
+
+async def run_migrations() -> list[int]:
+    """
+    Apply the pending migrations and return their versions.
+
+    When the schema is already current this costs a single query and no DDL.
+    """
+    try:
+        applied = await applied_versions()
+    except SQLAlchemyError:
+        # first boot: the database or the version table does not exist yet
+        await create_database()
+        async with engine.begin() as connection:
+            await connection.run_sync(SchemaVersionDb.__table__.create, checkfirst=True)
+        applied = await applied_versions()
+
+    pending = [m for m in MIGRATIONS if m.enabled() and m.version not in applied]
+    for migration in pending:
+        async with engine.begin() as connection:
+            await migration.upgrade(connection)
+        try:
+            async with engine.begin() as connection:
+                await connection.execute(
+                    SchemaVersionDb.__table__.insert().values(
+                        version=migration.version, name=migration.name
+                    )
+                )
+        except IntegrityError:
+            # another worker applied the same migration concurrently
+            pass
+        print(f"Applied migration {migration.version}: {migration.name}")
+
+    return [migration.version for migration in pending]
@@ -1,17 +1,31 @@
 """notes.py"""
 
-from typing import Optional, Annotated
+from typing import Optional, Annotated, Union, AsyncIterator
 from datetime import datetime
 # from sqlalchemy import and_, or_
 from enum import Enum
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import select, Select, text, update, delete, insert, func
+from sqlalchemy.dialects.mysql import match
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import Path, Depends
-from api.database import NoteDb, get_db, UserDb
+from api.config import SEARCH_ENGINE, EXPORT_BATCH_SIZE, IMPORT_BATCH_SIZE, IMPORT_MAX_ERRORS,\
+    NOTE_PREVIEW_LENGTH
+from api.database import NoteDb, use_session, UserDb, notes_fts, SessionLocal
 from api.utils.session import SessionManager, get_session_manager, get_current_user_id
+from api.utils.helpers import keyset_paginate, next_page, encode_cursor, decode_cursor
+from api.utils.search_index import search_index, tokenize
+from api.utils.note_cache import note_cache
+from api.utils.http_cache import make_etag, http_date
+from api.utils.serialization import dumps, to_record
+from api.utils.metrics import track_queries
 
 
 NoteId = Annotated[int, Path(gt=0)]
+
+# checked before writing: notes.title is a VARCHAR(100) and a MySQL TEXT holds 65535 bytes
+TITLE_MAX_LENGTH = NoteDb.title.type.length
+CONTENT_MAX_BYTES = 65535
 TimeChanged = Annotated[Optional[datetime], Field(default_factory=datetime.utcnow)]
 
 SessionRequest = Annotated[SessionManager, Depends(get_session_manager)]
@@ -27,22 +41,32 @@ class NoteField(str, Enum):
     CONTENT = "content"
 
 
+class NoteView(str, Enum):
+    """Enum for note listing views"""
+    FULL = "full"
+    SUMMARY = "summary"
+
+
 class BaseNote(BaseModel):
     """Note model"""
-    title: Optional[str] = None
+    title: Optional[str] = Field(None, max_length=TITLE_MAX_LENGTH)
     content: str
 
 
 class CreateNote(BaseNote):
-    """Create note model"""
+    """Create note model, a null edition time falls back to the creation time"""
     user_id: Optional[int] = None
     time_created: TimeChanged
     time_edition: TimeChanged
 
+    def model_post_init(self, __context):
+        # the notes.time_edition column is NOT NULL
+        if self.time_edition is None:
+            self.time_edition = self.time_created or datetime.utcnow()
+
 
 class UpdateNote(BaseNote):
-    """Update note model"""
-    time_edition: TimeChanged
+    """Update note model, the edition time is always set by the server"""
 
 
 class NoteDetails(CreateNote):
@@ -50,17 +74,109 @@ class NoteDetails(CreateNote):
     id: NoteId
 
 
+class NotePage(BaseModel):
+    """A page of notes with the cursor of the next page"""
+    items: list[NoteDetails]
+    next_cursor: Optional[str] = None
+
+
+class BatchOperation(str, Enum):
+    """Enum for batch operations"""
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+
+
+class NoteOperation(BaseModel):
+    """One operation of a note batch, `id` is required to update or delete"""
+    op: BatchOperation
+    id: Optional[int] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+
+    def length_error(self) -> Optional[str]:
+        """Error of a title or a content too long for its column, None if they fit"""
+        if self.title is not None and len(self.title) > TITLE_MAX_LENGTH:
+            return f"title is longer than {TITLE_MAX_LENGTH} characters"
+        if self.content is not None and len(self.content.encode()) > CONTENT_MAX_BYTES:
+            return f"content is larger than {CONTENT_MAX_BYTES} bytes"
+        return None
+
+
+class NoteBatch(BaseModel):
+    """Note batch model, `atomic` applies nothing if any operation fails"""
+    operations: list[NoteOperation]
+    atomic: bool = False
+
+
+class NoteBatchItem(BaseModel):
+    """Result of one operation of a note batch"""
+    index: int
+    op: BatchOperation
+    id: Optional[int] = None
+    status: str
+    error: Optional[str] = None
+    code: Optional[int] = None
+
+
+class NoteBatchResult(BaseModel):
+    """Result of a note batch"""
+    applied: int
+    failed: int
+    results: list[NoteBatchItem]
+
+
+class NoteImportResult(BaseModel):
+    """Result of a note import"""
+    inserted: int = 0
+    failed: int = 0
+    batches: list[dict] = []
+    errors: list[dict] = []
+    errors_truncated: bool = False
+
+
+# Keyset columns, listing pages are ordered by id and user pages by last edition
+LIST_KEYS = (NoteDb.id,)
+USER_KEYS = (NoteDb.time_edition, NoteDb.id)
+
+# Reads select these columns as plain rows instead of loading NoteDb objects
+NOTE_COLUMNS = (
+    NoteDb.id, NoteDb.user_id, NoteDb.title, NoteDb.content,
+    NoteDb.time_created, NoteDb.time_edition
+)
+NOTE_FIELDS = tuple(column.key for column in NOTE_COLUMNS)
+
+# Summary listings leave the content column out, the preview is cut by the database
+SUMMARY_COLUMNS = (
+    NoteDb.id, NoteDb.title, NoteDb.time_edition,
+    func.substr(NoteDb.content, 1, NOTE_PREVIEW_LENGTH).label("preview")
+)
+VIEW_COLUMNS = {NoteView.FULL: NOTE_COLUMNS, NoteView.SUMMARY: SUMMARY_COLUMNS}
+
+
+@track_queries
 class Note():
     """Note Class"""
     def __init__(self):
-        self.sess = next(get_db())
+        self.session = use_session
+        self.cache = note_cache
 
-    def get_note_by_id(self, note_id: int):
+    async def get_note_by_id(self, note_id: int):
         """Fetches a note by its id."""
         try:
-            note = self.sess.query(NoteDb).filter(NoteDb.id == note_id).first()
+            key = await self.cache.note_key(note_id)
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
+
+            async with self.session() as sess:
+                note = (await sess.execute(
+                    select(*NOTE_COLUMNS).where(NoteDb.id == note_id)
+                )).first()
 
             if note:
+                note = note._asdict()
+                await self.cache.set(key, note)
                 return note
 
             return f"Note (id = {note_id}) not found"
@@ -69,23 +185,46 @@ class Note():
                 f"An error occurred while fetching note by id: {e}"
             ) from e
 
-    def get_notes_by_user_id(
+    async def get_notes_by_user_id(
         self,
         user_id: int,
         skip: Optional[int] = None,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        view: NoteView = NoteView.FULL
     ):
-        """Fetches all notes by user id."""
+        """Fetches all notes by user id, newest edition first in cursor mode."""
         try:
-            user_exists = self.sess.query(UserDb).filter(UserDb.id == user_id).first()
-            if not user_exists:
-                return f"User with id {user_id} does not exist."
-
-            notes = self.sess.query(NoteDb).filter(NoteDb.user_id == user_id).all()
-
-            notes = self.skip_and_limit_selected(notes, skip, limit)
+            variant = f"{view.value}:{skip}:{limit}:{cursor}"
+            key = await self.cache.list_key(user_id, variant)
+            cached = await self.cache.get(key)
+            if isinstance(cached, dict):
+                return NotePage.model_construct(**cached)
+            if cached:
+                return cached
+
+            async with self.session() as sess:
+                user_exists = await sess.scalar(select(UserDb.id).where(UserDb.id == user_id))
+                if not user_exists:
+                    return f"User with id {user_id} does not exist."
+
+                notes = select(*VIEW_COLUMNS[view]).where(NoteDb.user_id == user_id)
+
+                if cursor is not None:
+                    page = await self.select_page(
+                        sess, notes, USER_KEYS, cursor, limit, descending=True
+                    )
+                    if isinstance(page, NotePage):
+                        await self.cache.set(
+                            key, {"items": page.items, "next_cursor": page.next_cursor}
+                        )
+                    return page
+
+                notes = self.skip_and_limit_selected(notes.order_by(*USER_KEYS), skip, limit)
+                notes = [row._asdict() for row in (await sess.execute(notes)).all()]
 
             if notes:
+                await self.cache.set(key, notes)
                 return notes
 
             return f"No notes found for user (id = {user_id})"
@@ -94,17 +233,31 @@ class Note():
                 f"An error occurred while fetching notes by user id: {e}"
             ) from e
 
-    def get_all_notes(self, skip: Optional[int] = None, limit: Optional[int] = None):
+    async def get_all_notes(
+        self,
+        skip: Optional[int] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        view: NoteView = NoteView.FULL
+    ):
         """Fetches all notes from the database."""
         try:
-            notes = self.sess.query(NoteDb)
+            columns = VIEW_COLUMNS[view]
+            if cursor is not None:
+                async with self.session() as sess:
+                    return await self.select_page(
+                        sess, select(*columns), LIST_KEYS, cursor, limit
+                    )
 
-            notes = Note.skip_and_limit_selected(notes, skip, limit)
+            notes = Note.skip_and_limit_selected(select(*columns), skip, limit)
+
+            async with self.session() as sess:
+                notes = [row._asdict() for row in (await sess.execute(notes)).all()]
 
             if not notes:
                 return "No notes found"
 
-            if isinstance(notes, list) and len(notes) == 1:
+            if len(notes) == 1:
                 return notes[0]
             return notes
         except Exception as e:
@@ -112,28 +265,45 @@ class Note():
                 f"An error occurred while fetching note by id: {e}"
             ) from e
 
-    def search_notes(
+    async def search_notes(
         self, field: str, query: str,
-        skip: Optional[int] = None, limit: Optional[int] = None
+        skip: Optional[int] = None, limit: Optional[int] = None,
+        cursor: Optional[str] = None, user_id: Optional[int] = None,
+        view: NoteView = NoteView.FULL
     ):
         """Search notes based on field and query."""
         try:
-            notes = None
+            if search_index.ready:
+                return await self.search_indexed_notes(
+                    field, query, skip, limit, cursor, user_id, view
+                )
+            if SEARCH_ENGINE == "fulltext":
+                return await self.search_fulltext_notes(
+                    field, query, skip, limit, cursor, user_id, view
+                )
+
             q = query.lower()
 
-            notes = self.sess.query(NoteDb).filter(
+            notes = select(*VIEW_COLUMNS[view]).where(
                 getattr(NoteDb, field).like(f'%{q}%')
             )
 
-            if not notes:
-                return "No notes found"
+            if user_id is not None:
+                notes = notes.where(NoteDb.user_id == user_id)
+
+            if cursor is not None:
+                async with self.session() as sess:
+                    return await self.select_page(sess, notes, LIST_KEYS, cursor, limit)
 
             notes = Note.skip_and_limit_selected(notes, skip, limit)
 
+            async with self.session() as sess:
+                notes = [row._asdict() for row in (await sess.execute(notes)).all()]
+
             if not notes:
                 return f"No notes found '{query}' for the search query."
 
-            if isinstance(notes, list) and len(notes) == 1:
+            if len(notes) == 1:
                 return notes[0]
             return notes
         except Exception as e:
@@ -141,7 +311,133 @@ class Note():
                 f"An error occurred while searching notes: {e}"
             ) from e
 
-    def create_a_new_note(
+    async def search_indexed_notes(
+        self, field: str, query: str,
+        skip: Optional[int] = None, limit: Optional[int] = None,
+        cursor: Optional[str] = None, user_id: Optional[int] = None,
+        view: NoteView = NoteView.FULL
+    ):
+        """Search notes through the in-memory index, best match first."""
+        try:
+            start, end = self.ranked_window(skip, limit, cursor)
+        except ValueError as e:
+            return str(e)
+
+        ranked = search_index.search(field, query, user_id)
+        page_ids = ranked[start:end]
+
+        notes = []
+        if page_ids:
+            async with self.session() as sess:
+                rows = (await sess.execute(
+                    select(*VIEW_COLUMNS[view]).where(NoteDb.id.in_(page_ids))
+                )).all()
+            rank = {note_id: i for i, note_id in enumerate(page_ids)}
+            notes = [row._asdict() for row in sorted(rows, key=lambda note: rank[note.id])]
+
+        return self.ranked_result(notes, query, cursor, end, end is not None and end < len(ranked))
+
+    async def search_fulltext_notes(
+        self, field: str, query: str,
+        skip: Optional[int] = None, limit: Optional[int] = None,
+        cursor: Optional[str] = None, user_id: Optional[int] = None,
+        view: NoteView = NoteView.FULL
+    ):
+        """Search notes through the database full-text index, best match first."""
+        try:
+            start, end = self.ranked_window(skip, limit, cursor)
+        except ValueError as e:
+            return str(e)
+
+        terms = [
+            (token, word.endswith("*")) for word in query.split() for token in tokenize(word)
+        ]
+        if not terms:
+            return f"No notes found '{query}' for the search query."
+
+        column = getattr(NoteDb, field)
+        columns = VIEW_COLUMNS[view]
+        async with self.session() as sess:
+            if sess.bind.dialect.name == "sqlite":
+                # FTS5: the column filter applies to the whole group, every quoted term
+                # must match in that column, bm25 is lower for better
+                expression = f"{column.key} : (" + " ".join(
+                    f'"{term}"' + ("*" if prefix else "") for term, prefix in terms
+                ) + ")"
+                notes = select(*columns).join(notes_fts, notes_fts.c.rowid == NoteDb.id).where(
+                    text("notes_fts MATCH :expression").bindparams(expression=expression)
+                ).order_by(text("bm25(notes_fts)"), NoteDb.id.desc())
+            else:
+                score = match(column, against=" ".join(
+                    f"+{term}" + ("*" if prefix else "") for term, prefix in terms
+                ))
+                score = score.in_boolean_mode()
+                notes = select(*columns).where(score).order_by(score.desc(), NoteDb.id.desc())
+
+            if user_id is not None:
+                notes = notes.where(NoteDb.user_id == user_id)
+
+            page_size = None if end is None else end - start
+            notes = notes.offset(start)
+            if page_size is not None:
+                # one extra row tells if there is a next page
+                notes = notes.limit(page_size + 1)
+
+            notes = [row._asdict() for row in (await sess.execute(notes)).all()]
+
+        has_more = page_size is not None and len(notes) > page_size
+        return self.ranked_result(notes[:page_size], query, cursor, end, has_more)
+
+    @staticmethod
+    def ranked_window(
+        skip: Optional[int] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> tuple[int, Optional[int]]:
+        """Return the (start, end) positions of a page of ranked results"""
+        if cursor:
+            try:
+                skip = int(decode_cursor(cursor)[0])
+            except (ValueError, TypeError, IndexError) as e:
+                raise ValueError(f"Invalid cursor: {cursor}") from e
+
+        start = skip or 0
+        if limit:
+            return start, start + limit
+        if skip or cursor is not None:
+            return start, start + 10
+        return start, None
+
+    @staticmethod
+    def ranked_result(notes: list, query: str, cursor: Optional[str], end: Optional[int],
+                      has_more: bool):
+        """Shape a page of ranked notes like the other search results"""
+        if cursor is not None:
+            return NotePage.model_construct(
+                items=notes, next_cursor=encode_cursor([end]) if has_more else None
+            )
+
+        if not notes:
+            return f"No notes found '{query}' for the search query."
+
+        if len(notes) == 1:
+            return notes[0]
+        return notes
+
+    async def build_search_index(self):
+        """Load every note into the in-memory search index"""
+        search_index.clear()
+        async with self.session() as sess:
+            result = await sess.stream(
+                select(NoteDb.id, NoteDb.user_id, NoteDb.title, NoteDb.content)
+                .execution_options(yield_per=1000)
+            )
+            async for row in result:
+                search_index.add(*row)
+        search_index.ready = True
+        return len(search_index)
+
+    async def create_a_new_note(
         self, item: CreateNote,
         current_user_id: Annotated[int, Depends(get_current_user_id)]
     ) -> NoteDetails:
@@ -157,68 +453,364 @@ class Note():
 
             new_note = NoteDb(**item.model_dump())
 
-            self.sess.add(new_note)
-            self.sess.commit()
-            self.sess.refresh(new_note)
+            async with self.session() as sess:
+                sess.add(new_note)
+                await sess.commit()
+                await sess.refresh(new_note)
+
+            if search_index.ready:
+                search_index.add_note(new_note)
+            await self.cache.invalidate(new_note.user_id)
 
             return new_note
         except Exception as e:
             raise SQLAlchemyError(f"An error occurred while creating a new note: {e}") from e
 
-    def update_note_data(self, note_id: NoteId, note_data: UpdateNote) -> NoteDetails:
+    async def update_note_data(self, note_id: NoteId, note_data: UpdateNote) -> NoteDetails:
         """Updates the note data in the database."""
         try:
-            old_note = self.sess.query(NoteDb).filter(
-                NoteDb.id == note_id
-            ).first()
+            async with self.session() as sess:
+                old_note = await sess.scalar(
+                    select(NoteDb).where(NoteDb.id == note_id)
+                )
+
+                if old_note is None:
+                    raise ValueError(f"No note found with id {note_id}")
 
-            if old_note is None:
-                raise ValueError(f"No note found with id {note_id}")
+                # time_edition versions the note for ETags, only the server sets it
+                changes = note_data.model_dump(exclude_unset=True)
+                changes["time_edition"] = datetime.utcnow()
+                for key, value in changes.items():
+                    setattr(old_note, key, value)
 
-            for key, value in note_data.model_dump(exclude_unset=True).items():
-                setattr(old_note, key, value)
+                await sess.commit()
+                await sess.refresh(old_note)
 
-            self.sess.commit()
-            self.sess.refresh(old_note)
+            if search_index.ready:
+                search_index.add_note(old_note)
+            await self.cache.invalidate(old_note.user_id, [note_id])
 
             return old_note
         except Exception as e:
             raise SQLAlchemyError(f"An error occurred while updating note data: {e}") from e
 
-    def delete_note_by_id(self, note_id: NoteId):
+    async def delete_note_by_id(self, note_id: NoteId):
         """Deletes a note by its ID."""
+        async with self.session() as sess:
+            try:
+                note = await sess.scalar(select(NoteDb).where(NoteDb.id == note_id))
+
+                if note is None:
+                    raise ValueError(f"No note found with id {note_id}")
+
+                await sess.delete(note)
+                await sess.commit()
+
+                search_index.remove(note_id)
+                await self.cache.invalidate(note.user_id, [note_id])
+            except ValueError as ve:
+                raise ve
+            except Exception as e:
+                await sess.rollback()
+                raise SQLAlchemyError(f"An error occurred while deleting note by ID: {e}") from e
+
+    async def apply_note_batch(
+        self, batch: NoteBatch, current_user_id: Optional[int]
+    ) -> NoteBatchResult:
+        """Applies a batch of note operations with bulk statements in one transaction."""
+        now = datetime.utcnow()
+        results: list[NoteBatchItem] = [
+            NoteBatchItem(index=i, op=operation.op, id=operation.id, status="ok")
+            for i, operation in enumerate(batch.operations)
+        ]
+
+        def fail(i: int, error: str, code: int = 400):
+            results[i].status = "error"
+            results[i].error = error
+            results[i].code = code
+
         try:
-            note = self.sess.query(NoteDb).filter(NoteDb.id == note_id).first()
+            async with self.session() as sess:
+                referenced = {o.id for o in batch.operations if o.op != BatchOperation.CREATE}
+                owners = dict((await sess.execute(
+                    select(NoteDb.id, NoteDb.user_id).where(NoteDb.id.in_(referenced))
+                )).all()) if referenced else {}
+
+                creates, updates, deletes, seen = [], [], [], set()
+                for i, operation in enumerate(batch.operations):
+                    # rejected here, a database error would fail the whole batch
+                    if error := operation.length_error():
+                        fail(i, error)
+                        continue
+
+                    if operation.op == BatchOperation.CREATE:
+                        if current_user_id is None:
+                            fail(i, "Current user id is not available", 401)
+                        elif operation.content is None:
+                            fail(i, "content is required to create a note")
+                        else:
+                            creates.append((i, {
+                                "user_id": current_user_id, "title": operation.title,
+                                "content": operation.content, "time_created": now,
+                                "time_edition": now,
+                            }))
+                        continue
+
+                    if operation.id is None:
+                        fail(i, f"id is required to {operation.op.value} a note")
+                    elif operation.id not in owners:
+                        fail(i, f"No note found with id {operation.id}", 404)
+                    elif current_user_id is None:
+                        fail(i, "Current user id is not available", 401)
+                    elif owners[operation.id] != current_user_id:
+                        fail(i, f"Note {operation.id} belongs to another user", 403)
+                    elif operation.id in seen:
+                        fail(i, f"Note {operation.id} appears more than once in the batch")
+                    elif operation.op == BatchOperation.UPDATE:
+                        values = operation.model_dump(include={"title", "content"}, exclude_none=True)
+                        if not values:
+                            fail(i, "title or content is required to update a note")
+                        else:
+                            updates.append({"id": operation.id, "time_edition": now, **values})
+                    else:
+                        deletes.append(operation.id)
+                    seen.add(operation.id)
+
+                failed = sum(result.status == "error" for result in results)
+                if failed and batch.atomic:
+                    for result in results:
+                        if result.status == "ok":
+                            result.status = "skipped"
+                    return NoteBatchResult(applied=0, failed=failed, results=results)
+
+                if creates:
+                    rows = [values for _, values in creates]
+                    if sess.bind.dialect.insert_executemany_returning_sort_by_parameter_order:
+                        ids = (await sess.scalars(
+                            insert(NoteDb).returning(NoteDb.id, sort_by_parameter_order=True),
+                            rows
+                        )).all()
+                    else:
+                        # no RETURNING (MySQL): one multi-row INSERT, its ids follow the first
+                        first = (await sess.execute(insert(NoteDb).values(rows))).lastrowid
+                        ids = range(first, first + len(rows))
+                    for (i, values), note_id in zip(creates, ids):
+                        results[i].id = values["id"] = note_id
+                if updates:
+                    await sess.execute(update(NoteDb), updates)
+                if deletes:
+                    await sess.execute(delete(NoteDb).where(NoteDb.id.in_(deletes)))
+                await sess.commit()
+
+                if search_index.ready:
+                    for _, values in creates:
+                        search_index.add(
+                            values["id"], current_user_id, values["title"], values["content"]
+                        )
+                    if updates:
+                        updated = await sess.stream(select(
+                            NoteDb.id, NoteDb.user_id, NoteDb.title, NoteDb.content
+                        ).where(NoteDb.id.in_([values["id"] for values in updates])))
+                        async for row in updated:
+                            search_index.add(*row)
+                    for note_id in deletes:
+                        search_index.remove(note_id)
+        except Exception as e:
+            raise SQLAlchemyError(f"An error occurred while applying the note batch: {e}") from e
+
+        changed = [values["id"] for values in updates] + deletes
+        for user_id in {current_user_id if creates else None, *(owners[i] for i in changed)}:
+            if user_id is not None:
+                await self.cache.invalidate(
+                    user_id, [note_id for note_id in changed if owners[note_id] == user_id]
+                )
+
+        return NoteBatchResult(
+            applied=len(creates) + len(updates) + len(deletes), failed=failed, results=results
+        )
+
+    async def export_notes(self, user_id: int) -> AsyncIterator[bytes]:
+        """
+        Streams the notes of a user as NDJSON, one chunk per batch of rows.
+
+        Rows are read through a server-side cursor on a session of its own,
+        the request session is already closed while the response streams.
+        """
+        async with SessionLocal() as sess:
+            result = await sess.stream(
+                select(*NOTE_COLUMNS).where(NoteDb.user_id == user_id).order_by(NoteDb.id)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            async for rows in result.partitions():
+                yield b"".join(dumps(row._asdict()) + b"\n" for row in rows)
+
+    async def import_notes(
+        self, rows: AsyncIterator[tuple[int, Union[dict, str]]], user_id: int
+    ) -> NoteImportResult:
+        """
+        Validates rows against CreateNote and inserts them for the user in
+        multi-row statements of IMPORT_BATCH_SIZE, committing each batch.
+        """
+        result = NoteImportResult()
+        batch: list[dict] = []
+
+        def report(number: int, error: str):
+            result.failed += 1
+            if len(result.errors) < IMPORT_MAX_ERRORS:
+                result.errors.append({"row": number, "error": error})
+            else:
+                result.errors_truncated = True
 
-            if note is None:
-                raise ValueError(f"No note found with id {note_id}")
+        async def flush(sess):
+            await sess.execute(insert(NoteDb), batch)
+            await sess.commit()
+            result.inserted += len(batch)
+            result.batches.append({
+                "batch": len(result.batches) + 1, "rows": len(batch), "inserted": result.inserted
+            })
+            batch.clear()
 
-            self.sess.delete(note)
-            self.sess.commit()
-        except ValueError as ve:
-            raise ve
+        try:
+            async with self.session() as sess:
+                async for number, row in rows:
+                    if isinstance(row, str):
+                        report(number, row)
+                        continue
+
+                    # notes always go to the importing user, exported ids are dropped
+                    row = {key: value for key, value in row.items() if key not in ("id", "user_id")}
+                    try:
+                        note = CreateNote.model_validate(row)
+                    except ValidationError as e:
+                        report(number, "; ".join(
+                            f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                            for error in e.errors()
+                        ))
+                        continue
+
+                    batch.append({**note.model_dump(), "user_id": user_id})
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        await flush(sess)
+
+                if batch:
+                    await flush(sess)
         except Exception as e:
-            self.sess.rollback()
-            raise SQLAlchemyError(f"An error occurred while deleting note by ID: {e}") from e
+            raise SQLAlchemyError(f"An error occurred while importing notes: {e}") from e
+        finally:
+            if result.inserted:
+                await self.cache.invalidate(user_id)
+                if search_index.ready:
+                    await self.index_user_notes(user_id)
+
+        return result
+
+    async def index_user_notes(self, user_id: int):
+        """Reload the notes of a user into the in-memory search index"""
+        async with self.session() as sess:
+            result = await sess.stream(
+                select(NoteDb.id, NoteDb.user_id, NoteDb.title, NoteDb.content)
+                .where(NoteDb.user_id == user_id)
+                .execution_options(yield_per=1000)
+            )
+            async for row in result:
+                search_index.add(*row)
+
+    async def get_note_versions(self, note_id: int) -> list[tuple]:
+        """Fetches only the (id, time_edition) of a note, to validate a cached copy."""
+        cached = await self.cache.get(await self.cache.note_key(note_id))
+        if cached is not None:
+            return self.note_versions(cached)
+
+        async with self.session() as sess:
+            return (await sess.execute(
+                select(NoteDb.id, NoteDb.time_edition).where(NoteDb.id == note_id)
+            )).all()
+
+    async def get_user_note_versions(
+        self,
+        user_id: int,
+        skip: Optional[int] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> list[tuple]:
+        """Fetches the (id, time_edition) of one page of a user's notes, without the content."""
+        notes = select(NoteDb.id, NoteDb.time_edition).where(NoteDb.user_id == user_id)
+
+        if cursor is not None:
+            try:
+                notes = keyset_paginate(notes, USER_KEYS, cursor, limit, descending=True)
+            except ValueError:
+                return []
+        else:
+            notes = self.skip_and_limit_selected(notes.order_by(*USER_KEYS), skip, limit)
+
+        async with self.session() as sess:
+            rows = (await sess.execute(notes)).all()
+
+        if cursor is not None:
+            rows, _ = next_page(rows, USER_KEYS, limit)
+        return rows
+
+    @staticmethod
+    def note_versions(notes) -> list[tuple]:
+        """Return the (id, time_edition) pairs of a note, a list of notes or a page"""
+        if isinstance(notes, NotePage):
+            notes = notes.items
+        if not isinstance(notes, (list, tuple)):
+            notes = [notes]
+
+        versions = []
+        for note in notes:
+            if isinstance(note, dict):
+                note_id, time_edition = note["id"], note["time_edition"]
+            else:
+                note_id, time_edition = note.id, note.time_edition
+            if isinstance(time_edition, str):
+                time_edition = datetime.fromisoformat(time_edition)
+            versions.append((note_id, time_edition))
+        return versions
+
+    @staticmethod
+    def note_validators(
+        versions: list[tuple], view: NoteView = NoteView.FULL
+    ) -> tuple[str, Optional[str]]:
+        """Return the (ETag, Last-Modified) headers of (id, time_edition) pairs"""
+        parts = [f"{note_id}@{time_edition.isoformat() if time_edition else ''}"
+                 for note_id, time_edition in versions]
+        if view != NoteView.FULL:
+            # every view is a representation of its own
+            parts.append(view.value)
+        etag = make_etag(parts, weak=True)
+        editions = [time_edition for _, time_edition in versions if time_edition]
+        return etag, http_date(max(editions)) if editions else None
 
     @classmethod
     def convert_class_note_to_object(cls, note: NoteDb) -> dict:
-        """Converts a Note_db object to a Note dict"""
-        return {
-            "id": note.id,
-            "user_id": note.user_id,
-            "title": note.title,
-            "content": note.content,
-            "time_created": note.time_created,
-            "time_edition": note.time_edition,
-        }
+        """Converts a Note_db object (or a note row) to a Note dict"""
+        return to_record(note, NOTE_FIELDS)
+
+    @staticmethod
+    async def select_page(
+        sess, notes: Select, keys: tuple,
+        cursor: str, limit: Optional[int] = None, descending: bool = False
+    ) -> Union[NotePage, str]:
+        """Fetch one keyset page of the selected note columns, trusted rows skip validation"""
+        try:
+            notes = keyset_paginate(notes, keys, cursor, limit, descending)
+        except ValueError as e:
+            return str(e)
+
+        items, next_cursor = next_page((await sess.execute(notes)).all(), keys, limit)
+        return NotePage.model_construct(
+            items=[row._asdict() for row in items], next_cursor=next_cursor
+        )
 
     @staticmethod
     def skip_and_limit_selected(
-        notes,
+        notes: Select,
         skip: Optional[int] = None,
         limit: Optional[int] = None
-    ):
+    ) -> Select:
         """skip and limit the selected notes"""
         if skip is not None and limit is not None:
             notes = notes.offset(skip).limit(limit)
@@ -227,4 +819,4 @@ class Note():
         elif skip and limit is None:
             notes = notes.offset(skip).limit(10)
 
-        return notes.all()
+        return notes
@@ -1,12 +1,24 @@
 """users.py"""
 
-from typing import Union, Optional
-from os import makedirs, path
+from typing import Union, Optional, NamedTuple
+from os import path
+from hashlib import sha256
+from uuid import uuid4
 from enum import Enum
+from anyio import Path as AsyncPath, open_file
 from pydantic import BaseModel
-from sqlalchemy import or_, and_
+from sqlalchemy import select, or_, and_
 from sqlalchemy.exc import SQLAlchemyError
-from api.database import UserDb, get_db
+from api.config import SESSION_CACHE_SIZE, SESSION_CACHE_TTL, UPLOAD_CHUNK_SIZE,\
+    PROFILE_IMAGE_MAX_BYTES, IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL
+from api.database import UserDb, use_session
+from api.utils.cache import TTLCache
+from api.utils.helpers import keyset_paginate, next_page
+from api.utils.passwords import password_hasher
+from api.utils.session_store import session_store
+from api.utils.metrics import track_queries
+from api.utils.images import ImageFile, generate_variants, sniff_media_type, write_metadata,\
+    read_metadata
 
 
 # Predefined values
@@ -39,40 +51,88 @@ class UserDetails(BaseUser):
     last_opened: Optional[str] = None
 
 
+class UserPage(BaseModel):
+    """A page of users with the cursor of the next page"""
+    items: list[BaseUser]
+    next_cursor: Optional[str] = None
+
+
+# Public user fields, listings select them as plain rows (id for the keyset cursor)
+USER_FIELDS = tuple(BaseUser.model_fields)
+USER_COLUMNS = (UserDb.id, *(getattr(UserDb, field) for field in USER_FIELDS))
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the allowed size"""
+
+
+class SessionUser(NamedTuple):
+    """Compact user record cached per session id"""
+    id: int
+    username: str
+    email: str
+    session_id: str
+    profile_image: Optional[str] = None
+
+
+@track_queries
 class User():
     """User Class"""
     def __init__(self, image_path: str = "./images/profile"):
-        self.sess = next(get_db())
+        self.session = use_session
         self.path_folder = image_path
+        self.session_cache = TTLCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL)
+        self.image_cache = TTLCache(IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL)
 
-    def get_user_by_id(self, user_id):
+    async def get_user_by_id(self, user_id):
         """Get user by id function"""
         try:
-            user = self.sess.query(UserDb).filter(
-                UserDb.id == user_id
-            ).first()
+            async with self.session() as sess:
+                user = await sess.scalar(
+                    select(UserDb).where(UserDb.id == user_id)
+                )
             return user
         except SQLAlchemyError as e:
             raise SQLAlchemyError(f"Error getting user by id: {str(e)}") from e
 
-    def get_user_by_session_id(self, session_id):
-        """Get user by session id function"""
+    async def get_user_by_session_id(self, session_id) -> Optional[SessionUser]:
+        """Get user by session id function, served from the session cache when possible"""
+        if not session_id:
+            return None
+
+        user = self.session_cache.get(session_id)
+        if user is not None:
+            return user
+
         try:
-            user = self.sess.query(UserDb).filter(
-                UserDb.session_id == session_id
-            ).first()
+            async with self.session() as sess:
+                user = (await sess.execute(
+                    select(
+                        UserDb.id, UserDb.username, UserDb.email,
+                        UserDb.session_id, UserDb.profile_image
+                    ).where(UserDb.session_id == session_id)
+                )).first()
+
+            if user is None:
+                return None
+
+            user = SessionUser(*user)
+            self.session_cache.set(session_id, user)
             return user
         except SQLAlchemyError as e:
             raise SQLAlchemyError(f"Error getting user by session id: {str(e)}") from e
 
-    def get_user_by_username(
+    async def get_user_by_username(
         self, name: str, skip: Optional[int] = 0, limit: Optional[int] = None
     ) -> Union[list, dict, str]:
         """Get user by username function"""
         try:
-            users_data = self.sess.query(UserDb).filter(
-                UserDb.username.like(f"%{name.lower()}%")
-            ).offset(skip).limit(limit).all()
+            async with self.session() as sess:
+                users_data = (await sess.execute(
+                    select(*USER_COLUMNS).where(
+                        UserDb.username.like(f"%{name.lower()}%")
+                    ).offset(skip).limit(limit)
+                )).all()
 
             if not users_data:
                 return f"User with name {name} not found"
@@ -81,14 +141,26 @@ class User():
         except SQLAlchemyError as e:
             raise SQLAlchemyError(f"Error getting user by username: {e}") from e
 
-    def get_all_users_data(
+    async def get_all_users_data(
         self,
         skip: Optional[int],
-        limit: Optional[int]
-    ) -> list:
-        """Get all users in list of dict"""
+        limit: Optional[int],
+        cursor: Optional[str] = None
+    ) -> Union[list, UserPage, str]:
+        """Get all users in list of dict, or one keyset page when cursor is given"""
         try:
-            users = self.sess.query(UserDb)
+            users = select(*USER_COLUMNS)
+
+            if cursor is not None:
+                keys = (UserDb.id,)
+                try:
+                    users = keyset_paginate(users, keys, cursor, limit)
+                except ValueError as e:
+                    return str(e)
+
+                async with self.session() as sess:
+                    items, next_cursor = next_page((await sess.execute(users)).all(), keys, limit)
+                return UserPage.model_construct(items=items, next_cursor=next_cursor)
 
             if skip is not None and limit is not None:
                 users = users.offset(skip).limit(limit)
@@ -97,19 +169,23 @@ class User():
             elif skip is None and limit:
                 users = users.offset(0).limit(limit)
 
-            return users.all()
+            async with self.session() as sess:
+                return (await sess.execute(users)).all()
         except SQLAlchemyError as e:
             raise SQLAlchemyError(f"Error getting all users: {str(e)}") from e
 
-    def check_if_user_exists(self, username: str, email: str) -> Optional[UserDb]:
+    async def check_if_user_exists(self, username: str, email: str) -> Optional[UserDb]:
         """Check if user exists in database"""
         try:
-            user_existed = self.sess.query(UserDb).filter(
-                or_(
-                    UserDb.username == username,
-                    UserDb.email == email
+            async with self.session() as sess:
+                user_existed = await sess.scalar(
+                    select(UserDb).where(
+                        or_(
+                            UserDb.username == username,
+                            UserDb.email == email
+                        )
+                    )
                 )
-            ).first()
             if user_existed:
                 return user_existed
             return None
@@ -117,114 +193,209 @@ class User():
             raise SQLAlchemyError(f"Error checking user existence: {str(e)}") from e
 
     # authenticate_user Not Used ⬇
-    def authenticate_user(self, username: str, password: str) -> Union[dict, str]:
+    async def authenticate_user(self, username: str, password: str) -> Union[dict, str]:
         """Authenticate user by username and password"""
         try:
-            user = self.sess.query(UserDb).filter(
-                and_(
-                    or_(
-                        UserDb.username == username,
-                        UserDb.email == username
+            async with self.session() as sess:
+                user = await sess.scalar(
+                    select(UserDb).where(
+                        and_(
+                            or_(
+                                UserDb.username == username,
+                                UserDb.email == username
+                            )
+                            # UserDb.hashed_password == password
+                        )
                     )
-                    # UserDb.hashed_password == password
                 )
-            ).first()
             if user:
-                if user.hashed_password == password:
+                if await self.verify_password(user, password):
                     return self.convert_class_user_to_object(user)
                 return "Invalid password. password not correct"
             return "Invalid username. user not exists"
         except SQLAlchemyError as e:
             raise SQLAlchemyError(f"Error authenticating user: {e}") from e
 
-    def insert_new_user(self, **kwargs: dict):
+    async def insert_new_user(self, **kwargs: dict):
         """Insert new user into database"""
-        try:
-            new_user = UserDb(**kwargs)
-            self.sess.add(new_user)
-            self.sess.commit()
-            self.sess.refresh(new_user)
-            return new_user
-        except SQLAlchemyError as e:
-            self.sess.rollback()
-            raise SQLAlchemyError(f"Error inserting new user: {e}") from e
-
-    def update_user_account(self, kwargs: dict) -> dict:
+        async with self.session() as sess:
+            try:
+                new_user = UserDb(**kwargs)
+                sess.add(new_user)
+                await sess.commit()
+                await sess.refresh(new_user)
+                return new_user
+            except SQLAlchemyError as e:
+                await sess.rollback()
+                raise SQLAlchemyError(f"Error inserting new user: {e}") from e
+
+    async def update_user_account(self, kwargs: dict) -> dict:
         """Update user account information"""
-        try:
-            user = None
+        async with self.session() as sess:
+            try:
+                user = None
 
-            if kwargs.get("session_id"):
-                user = self.sess.query(UserDb).filter(
-                    UserDb.session_id == kwargs["session_id"]
-                ).first()
-            elif kwargs.get("id"):
-                user = self.sess.query(UserDb).filter(
-                    UserDb.id == kwargs["id"]
-                ).first()
+                if kwargs.get("session_id"):
+                    user = await sess.scalar(
+                        select(UserDb).where(UserDb.session_id == kwargs["session_id"])
+                    )
+                elif kwargs.get("id"):
+                    user = await sess.scalar(
+                        select(UserDb).where(UserDb.id == kwargs["id"])
+                    )
 
-            if user:
-                for key, value in kwargs.items():
-                    if key not in ['id', 'session_id'] and value is not None:
-                        setattr(user, key, value)
-                self.sess.commit()
-                return True
-            return False
-        except SQLAlchemyError as e:
-            self.sess.rollback()
-            raise SQLAlchemyError(f"Error updating user account: {e}") from e
+                if user:
+                    for key, value in kwargs.items():
+                        if key not in ['id', 'session_id'] and value is not None:
+                            setattr(user, key, value)
+                    await sess.commit()
+                    self.forget_session(user.session_id)
+                    await self.refresh_sessions(user)
+                    return True
+                return False
+            except SQLAlchemyError as e:
+                await sess.rollback()
+                raise SQLAlchemyError(f"Error updating user account: {e}") from e
+
+    async def load_user_profile_image(self, user_id) -> Optional[ImageFile]:
+        """Load user profile image metadata, served from the image cache when possible"""
+        image = self.image_cache.get(user_id)
+        if image is not None:
+            return image
 
-    async def load_user_profile_image(self, user_id):
-        """Load user profile image from files"""
         try:
-            user_folder = f"{self.path_folder}/{str(user_id)}"
-
-            if not path.exists(user_folder):
-                return None
-
-            return self.sess.query(UserDb).filter(UserDb.id == user_id).first().profile_image
+            async with self.session() as sess:
+                location = await sess.scalar(
+                    select(UserDb.profile_image).where(UserDb.id == user_id)
+                )
         except SQLAlchemyError as e:
             raise SQLAlchemyError(f"Error loading user profile image: {e}") from e
 
+        if not location:
+            return None
+
+        image = await read_metadata(location)
+        if image is not None:
+            self.image_cache.set(user_id, image)
+        return image
+
     async def create_dir_if_not_exists(self, user_id, file):
-        """Create a directory if it doesn't exist, and save the file."""
-        try:
-            user_folder = f"{self.path_folder}/{str(user_id)}"
+        """
+        Create a directory if it doesn't exist, and save the file.
+
+        The user is looked up and the transaction released before the upload
+        is saved and its variants rendered, so no pooled connection is held
+        meanwhile; the user is loaded again to record the new image.
+        """
+        async with self.session() as sess:
+            user_exists = await sess.scalar(select(UserDb.id).where(UserDb.id == user_id))
+            await sess.rollback()
+        if user_exists is None:
+            return None
 
-            if not path.exists(user_folder):
-                makedirs(user_folder)
+        user_folder = f"{self.path_folder}/{str(user_id)}"
+        await AsyncPath(user_folder).mkdir(parents=True, exist_ok=True)
 
-            file_name = f"current_image{path.splitext(file.filename)[1]}"
+        file_name = f"current_image{path.splitext(file.filename)[1]}"
 
-            file_location = f"{user_folder}/{file_name}"
-            with open(file_location, "wb") as f:
-                f.write(await file.read())
+        file_location = f"{user_folder}/{file_name}"
+        image = await self.save_upload(file, file_location)
+        image = image._replace(variants=tuple(await generate_variants(file_location)))
+        await write_metadata(image)
 
-            user = self.sess.query(UserDb).filter(UserDb.id == user_id).first()
-            user.profile_image = file_location
-            self.sess.commit()
+        async with self.session() as sess:
+            try:
+                user = await sess.scalar(select(UserDb).where(UserDb.id == user_id))
+                if user is None:
+                    return None
 
-            return file_location
-        except SQLAlchemyError as e:
-            self.sess.rollback()
-            raise SQLAlchemyError(f"Error update profile image: {e}") from e
+                user.profile_image = file_location
+                await sess.commit()
+                self.forget_session(user.session_id)
+                await self.refresh_sessions(user)
+                self.image_cache.set(user_id, image)
 
-    def delete_user(self, user_id: int) -> bool:
-        """Delete user Account permanently from database"""
+                return image
+            except SQLAlchemyError as e:
+                await sess.rollback()
+                raise SQLAlchemyError(f"Error update profile image: {e}") from e
+
+    @staticmethod
+    async def save_upload(
+        file, location: str,
+        max_bytes: int = PROFILE_IMAGE_MAX_BYTES, chunk_size: int = UPLOAD_CHUNK_SIZE
+    ) -> ImageFile:
+        """
+        Stream an upload to `location` in chunks without blocking the event loop.
+
+        The bytes go to a temporary file that replaces `location` atomically
+        once complete; the size limit is enforced, the content hashed and its
+        media type detected while the bytes are copied.
+        """
+        if file.size is not None and file.size > max_bytes:
+            raise UploadTooLarge(f"File is larger than {max_bytes} bytes")
+
+        temporary = AsyncPath(f"{location}.{uuid4().hex}.part")
+        size = 0
+        digest = sha256()
+        head = b""
         try:
-            user = self.sess.query(UserDb).filter(
-                UserDb.id == user_id
-            ).first()
+            async with await open_file(temporary, "wb") as f:
+                while chunk := await file.read(chunk_size):
+                    if len(head) < 16:
+                        head += chunk[:16]
+                    digest.update(chunk)
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise UploadTooLarge(f"File is larger than {max_bytes} bytes")
+                    await f.write(chunk)
+            await temporary.replace(location)
+        except BaseException:
+            await temporary.unlink(missing_ok=True)
+            raise
+        return ImageFile(location, sniff_media_type(head), digest.hexdigest(), size)
+
+    async def delete_user(self, user_id: int) -> bool:
+        """Delete user Account permanently from database"""
+        async with self.session() as sess:
+            try:
+                user = await sess.scalar(
+                    select(UserDb).where(UserDb.id == user_id)
+                )
 
-            if user:
-                self.sess.delete(user)
-                self.sess.commit()
-                return True
+                if user:
+                    await sess.delete(user)
+                    await sess.commit()
+                    self.forget_session(user.session_id)
+                    await self.revoke_sessions(user_id)
+                    self.image_cache.delete(user_id)
+                    return True
 
-            return False
-        except SQLAlchemyError as e:
-            self.sess.rollback()
-            raise SQLAlchemyError(f"Error deleting user with id ({user_id}): {e}") from e
+                return False
+            except SQLAlchemyError as e:
+                await sess.rollback()
+                raise SQLAlchemyError(f"Error deleting user with id ({user_id}): {e}") from e
+
+    def forget_session(self, session_id: Optional[str]):
+        """Drop the cached user of a session after it changed or logged out"""
+        if session_id:
+            self.session_cache.delete(session_id)
+
+    @staticmethod
+    def session_user(user: UserDb) -> dict:
+        """Compact user record kept in the server-side session data"""
+        return SessionUser(
+            user.id, user.username, user.email, user.session_id, user.profile_image
+        )._asdict()
+
+    async def refresh_sessions(self, user: UserDb) -> int:
+        """Update the user record of every session of a user after it changed"""
+        return await session_store.update_user(user.id, {"user": self.session_user(user)})
+
+    @staticmethod
+    async def revoke_sessions(user_id: int) -> int:
+        """Log a user out of every session, return how many were dropped"""
+        return await session_store.revoke_user(user_id)
 
     @classmethod
     def convert_class_user_to_object(cls, user: UserDb) -> dict:
@@ -242,6 +413,21 @@ class User():
         }
 
     @staticmethod
-    def hash_password(password: str):
-        """Hash password using bcrypt"""
-        return f"fake{password}"
+    async def hash_password(password: str) -> str:
+        """Hash password with the configured KDF, off the event loop"""
+        return await password_hasher.hash(password)
+
+    async def verify_password(self, user: UserDb, password: str) -> bool:
+        """
+        Check the password of a user, off the event loop.
+
+        A legacy or outdated hash is replaced with a current one on success.
+        """
+        if not await password_hasher.verify(password, user.hashed_password):
+            return False
+
+        if password_hasher.needs_rehash(user.hashed_password):
+            await self.update_user_account(
+                {"id": user.id, "hashed_password": await self.hash_password(password)}
+            )
+        return True
@@ -1,43 +1,143 @@
 """note_api.py"""
 
-from typing import Union, Optional, Annotated
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Union, Optional, Annotated, Literal
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
 from api.app import note_model
-from api.models.notes import NoteField, NoteDetails
+from api.database import get_db
+from api.utils.http_cache import is_conditional, is_not_modified
+from api.utils.helpers import gzip_stream, iter_ndjson_rows, iter_csv_rows
+from api.config import NOTE_BATCH_MAX_SIZE
+from api.models.notes import NoteField, NoteDetails, NotePage, NoteBatch, NoteBatchResult,\
+    NoteImportResult, NoteView, VIEW_COLUMNS
+from api.utils.serialization import JSONBytesResponse, to_records
+from api.utils.session import get_current_user_id
 # from api.utils.session import SessionManager, get_session_manager
 
 router = APIRouter(
     prefix='/api/notes',
-    tags=['note-api']
+    tags=['note-api'],
+    dependencies=[Depends(get_db)]
 )
 
 
+def validator_headers(
+    versions: list, view: NoteView = NoteView.FULL, single: bool = False
+) -> dict:
+    """
+    ETag headers of the given (id, time_edition) pairs, and Last-Modified for
+    a single note: the newest edition of a list does not change when one of
+    its notes is deleted, only the ETag does.
+    """
+    etag, last_modified = note_model.note_validators(versions, view)
+    headers = {"ETag": etag}
+    if single and last_modified:
+        headers["Last-Modified"] = last_modified
+    return headers
+
+
+def not_modified(req: Request, headers: dict) -> bool:
+    """Check the request validators against the response headers"""
+    return is_not_modified(req, headers["ETag"], headers.get("Last-Modified"))
+
+
+@router.get("/export")
+async def export_notes(
+    current_user_id: Annotated[Optional[int], Depends(get_current_user_id)],
+    user_id: Optional[int] = None,
+    gzip: bool = False,
+) -> StreamingResponse:
+    """
+    Export the notes of the current user as NDJSON, `user_id` must be theirs.
+
+    The body is streamed while the rows are read, optionally gzip encoded.
+    """
+    if not current_user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not logged in"
+        )
+    if user_id is not None and user_id != current_user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only export your own notes"
+        )
+    user_id = current_user_id
+
+    body = note_model.export_notes(user_id)
+    headers = {"Content-Disposition": f'attachment; filename="notes-{user_id}.ndjson"'}
+    if gzip:
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
+
+
 @router.get("/{field}")
 async def get_notes_by_field(
+    req: Request,
     field: NoteField,
     query: Optional[str] = None,
     note_id: Optional[int] = None,
     user_id: Optional[int] = None,
     skip: Optional[int] = None,
     limit: Optional[int] = None,
-) -> Union[dict, NoteDetails, list[NoteDetails]]:
-    """Get notes by field"""
+    cursor: Optional[str] = None,
+    view: NoteView = NoteView.FULL,
+) -> Union[NotePage, dict, NoteDetails, list[NoteDetails]]:
+    """
+    Get notes by field
+
+    Pass `cursor` (empty for the first page) to page with `next_cursor`
+    instead of `skip`, the cost of a page then stays the same at any depth.
+
+    Listings take `view=summary` for only `id`, `title`, `time_edition` and
+    a `preview` of the content, the full content is not read from the database.
+
+    Responses carry an ETag from the notes (id, time_edition), a single note
+    also Last-Modified; a matching If-None-Match (or If-Modified-Since for a
+    single note) gets 304 Not Modified.
+    """
     try:
         notes_data = None
+        if field == NoteField.ID:
+            # a single note is always returned in full
+            view = NoteView.FULL
+
+        # answer conditional requests from (id, time_edition) before loading the content
+        if is_conditional(req):
+            versions = None
+            match field:
+                case 'id' if note_id:
+                    versions = await note_model.get_note_versions(note_id)
+                case 'user_id' if user_id:
+                    versions = await note_model.get_user_note_versions(
+                        user_id, skip, limit, cursor
+                    )
+            if versions:
+                headers = validator_headers(versions, view, field == NoteField.ID)
+                if not_modified(req, headers):
+                    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
         match field:
             case 'id' if note_id:
-                notes_data = note_model.get_note_by_id(note_id)
+                notes_data = await note_model.get_note_by_id(note_id)
             case 'list':
-                notes_data = note_model.get_all_notes(skip=skip, limit=limit)
+                notes_data = await note_model.get_all_notes(
+                    skip=skip, limit=limit, cursor=cursor, view=view
+                )
             case 'title' | 'content':
                 if query:
-                    notes_data = note_model.search_notes(field, query, skip, limit)
+                    notes_data = await note_model.search_notes(
+                        field, query, skip, limit, cursor, user_id, view
+                    )
                 else:
                     notes_data = f"Invalid query for field: {field}."
             case 'user_id':
                 if user_id:
-                    notes_data = note_model.get_notes_by_user_id(user_id, skip, limit)
+                    notes_data = await note_model.get_notes_by_user_id(
+                        user_id, skip, limit, cursor, view
+                    )
                 else:
                     notes_data = f"Invalid user_id for field: {field}."
             case _:
@@ -49,7 +149,15 @@ async def get_notes_by_field(
                 detail=notes_data
             )
 
-        return notes_data
+        headers = validator_headers(
+            note_model.note_versions(notes_data), view, field == NoteField.ID
+        )
+        if not_modified(req, headers):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        # trusted rows from the database or the cache, encoded without model validation
+        fields = tuple(column.key for column in VIEW_COLUMNS[view])
+        return JSONBytesResponse(to_records(notes_data, fields), headers=headers)
     except HTTPException as http_ex:
         raise http_ex
     except Exception as e:
@@ -76,6 +184,63 @@ async def create_note(
         ) from e
 
 
+@router.post("/batch", response_model=NoteBatchResult)
+async def apply_note_batch(
+    batch: NoteBatch,
+    current_user_id: Annotated[Optional[int], Depends(get_current_user_id)]
+) -> NoteBatchResult:
+    """
+    Create, update and delete many notes in one transaction.
+
+    Every operation gets its own result; failed operations are reported and
+    the others applied, unless `atomic` is set.
+    """
+    if len(batch.operations) > NOTE_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch accepts at most {NOTE_BATCH_MAX_SIZE} operations."
+        )
+
+    try:
+        return await note_model.apply_note_batch(batch, current_user_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        ) from e
+
+
+@router.post("/import", response_model=NoteImportResult)
+async def import_notes(
+    req: Request,
+    current_user_id: Annotated[Optional[int], Depends(get_current_user_id)],
+    format: Optional[Literal["ndjson", "csv"]] = None,  # pylint: disable=redefined-builtin
+) -> NoteImportResult:
+    """
+    Import notes for the current user from an NDJSON or CSV request body.
+
+    The body is parsed while it is received and inserted in batches, the
+    result reports the batches and the rows that failed validation.
+    """
+    if not current_user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Login is required to import notes."
+        )
+
+    if format is None:
+        format = "csv" if "csv" in req.headers.get("content-type", "") else "ndjson"
+    rows = iter_csv_rows(req.stream()) if format == "csv" else iter_ndjson_rows(req.stream())
+
+    try:
+        return await note_model.import_notes(rows, current_user_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        ) from e
+
+
 @router.put("/{note_id}/update", response_model=NoteDetails)
 async def update_note(
     note_data: Annotated[
@@ -4,19 +4,27 @@ from typing import Union, Optional, Annotated
 from uuid import uuid4
 from re import match
 from fastapi import APIRouter, HTTPException, Path, Depends, Body, Request, status, Form,\
-    File, UploadFile
-from fastapi.responses import RedirectResponse, FileResponse
+    File, UploadFile, Query
+from fastapi.responses import RedirectResponse, FileResponse, Response
 from api.app import user_model
-from api.database import UserDb
-from api.models.users import BaseUser, UserIn, UserField
-from api.utils.session import SessionManager, get_session_manager, get_current_user_id, clear_session
+from api.database import UserDb, get_db
+from api.models.users import BaseUser, UserIn, UserField, UserPage, UploadTooLarge, USER_FIELDS
+from api.utils.images import select_variant, read_small_image
+from api.utils.http_cache import make_etag, is_not_modified
+from api.utils.serialization import JSONBytesResponse, to_records
+from api.utils.passwords import HasherBusy
+from api.utils.session import SessionManager, get_session_manager, get_current_user_id, clear_session,\
+    is_admin
 
 
 router = APIRouter(
     prefix='/api/users',
-    tags=['user-api']
+    tags=['user-api'],
+    dependencies=[Depends(get_db)]
 )
 
+IMMUTABLE = "public, max-age=31536000, immutable"
+
 EMAIL_REGEX = r"^([a-z]+)((([a-z]+)|(_[a-z]+))?(([0-9]+)|(_[0-9]+))?)*@([a-z]+).([a-z]+)$"
 
 
@@ -28,28 +36,30 @@ async def get_user(
     name: Optional[str] = None,
     skip: Optional[int] = None,
     limit: Optional[int] = None,
+    cursor: Optional[str] = None,
     current_user_id: int = Depends(get_current_user_id)
-) -> Union[str, BaseUser, list[BaseUser]]:
+) -> Union[str, UserPage, BaseUser, list[BaseUser]]:
     """
     Get user by id, or
     get all users with optional filtering and pagination.
+    The list accepts `cursor` (empty for the first page) for keyset pagination.
     """
     users_data: Union[str, dict, list, None] = None
 
     match field:
         case "me":
-            users_data = user_model.get_user_by_id(current_user_id)
+            users_data = await user_model.get_user_by_id(current_user_id)
         case "id":
             if isinstance(user_id, int):
-                users_data = user_model.get_user_by_id(user_id)
+                users_data = await user_model.get_user_by_id(user_id)
             elif isinstance(user_id, str) and user_id == "me":
-                users_data = user_model.get_user_by_id(current_user_id)
+                users_data = await user_model.get_user_by_id(current_user_id)
             elif isinstance(user_id, str) and user_id.isdigit():
-                users_data = user_model.get_user_by_id(int(user_id))
+                users_data = await user_model.get_user_by_id(int(user_id))
         case "name" if name:
-            users_data = user_model.get_user_by_username(name, skip, limit)
+            users_data = await user_model.get_user_by_username(name, skip, limit)
         case "list":
-            users_data = user_model.get_all_users_data(skip, limit)
+            users_data = await user_model.get_all_users_data(skip, limit, cursor)
         case _:
             users_data = f"Invalid field: '{field}'."
 
@@ -59,13 +69,12 @@ async def get_user(
             detail="User not found"
         )
 
-    if isinstance(users_data, UserDb):
-        return users_data
+    # only the public fields of trusted rows are encoded, without model validation
+    if isinstance(users_data, (UserDb, UserPage)):
+        return JSONBytesResponse(to_records(users_data, USER_FIELDS))
 
     if isinstance(users_data, list):
-        if len(users_data) == 1:
-            return users_data
-        return users_data
+        return JSONBytesResponse(to_records(users_data, USER_FIELDS))
 
     raise HTTPException(
         status_code=status.HTTP_400_BAD_REQUEST,
@@ -93,7 +102,7 @@ async def login(
         username = None
 
     try:
-        current_user = user_model.check_if_user_exists(username=username, email=email)
+        current_user = await user_model.check_if_user_exists(username=username, email=email)
 
         if not current_user:
             raise HTTPException(
@@ -101,8 +110,7 @@ async def login(
                 detail="Invalid username or email. user not found"
             )
 
-        hashed_password = user_model.hash_password(password)
-        if current_user.hashed_password != hashed_password:
+        if not await user_model.verify_password(current_user, password):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid password. password not correct"
@@ -111,11 +119,17 @@ async def login(
         # Set session data for authenticated user
         req.session["id"] = current_user.id
         req.session["session_id"] = current_user.session_id
+        req.session["user"] = user_model.session_user(current_user)
 
         # return current_user
         return RedirectResponse(url="/home", status_code=302)
     except HTTPException as http_ex:
         raise http_ex
+    except HasherBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        ) from e
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -135,7 +149,7 @@ async def register(
 ) -> BaseUser:
     """Register a new user"""
     try:
-        existing_user = user_model.check_if_user_exists(username, email)
+        existing_user = await user_model.check_if_user_exists(username, email)
 
         if existing_user:
             error_field = "username" if existing_user.username == username else "email"
@@ -145,21 +159,27 @@ async def register(
             )
 
         # Insert new user and set session details
-        current_user = user_model.insert_new_user(
+        current_user = await user_model.insert_new_user(
             username=username,
             email=email,
-            hashed_password=user_model.hash_password(password),
+            hashed_password=await user_model.hash_password(password),
             # date_of_birth=date_of_birth,
             session_id=str(uuid4())
         )
 
         req.session["id"] = current_user.id
         req.session["session_id"] = current_user.session_id
+        req.session["user"] = user_model.session_user(current_user)
 
         # return current_user
         return RedirectResponse(url="/home", status_code=302)
     except HTTPException as http_ex:
         raise http_ex
+    except HasherBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        ) from e
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -222,6 +242,11 @@ async def update_user_data(
             user_id = int(user_id)
 
         user_dict = user_account.model_dump()
+        if user_dict["hashed_password"]:
+            # the new password comes in plain text, only its hash is stored
+            user_dict["hashed_password"] = await user_model.hash_password(
+                user_dict["hashed_password"]
+            )
 
         if isinstance(user_id, int) and user_id >= 1:
             user_dict["id"] = user_id
@@ -234,7 +259,7 @@ async def update_user_data(
                 detail="Invalid user_id. It should be either 'me' or a positive integer."
             )
 
-        if user_model.update_user_account(user_dict):
+        if await user_model.update_user_account(user_dict):
             return {
                 "message": "User data updated successfully",
                 "user_data": BaseUser(
@@ -250,6 +275,11 @@ async def update_user_data(
         )
     except HTTPException as http_ex:
         raise http_ex
+    except HasherBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        ) from e
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -266,6 +296,16 @@ async def get_user_profile_image(
             examples=[{"user_id": 19}, {"user_id": "me"}]
         )
     ],
+    req: Request,
+    size: Annotated[
+        Optional[int], Query(
+            gt=0,
+            title="Image size",
+            description="Width in px the image is shown at, the smallest variant "
+                "at least that wide is served (WebP if accepted)",
+            examples=[64]
+        )
+    ] = None,
     session: SessionManager = Depends(get_session_manager)
 ):
     """Get user profile image"""
@@ -276,11 +316,32 @@ async def get_user_profile_image(
         if user_id == "me":
             user_id = session.user_id
 
-        location_file = await user_model.load_user_profile_image(user_id)
+        image = await user_model.load_user_profile_image(user_id)
 
-        if location_file:
-            return FileResponse(location_file, media_type="image/jpeg")
-            # return Response(content=open(location_file, 'rb').read(), media_type="image/jpeg")
+        if image:
+            location_file, media_type = select_variant(
+                image, size, req.headers.get("accept", "")
+            )
+            headers = {
+                "ETag": make_etag((image.digest, location_file)),
+                # a URL carrying the content hash never changes, others are revalidated
+                "Cache-Control": IMMUTABLE if req.query_params.get("v") == image.version
+                    else "no-cache",
+                "X-Content-Type-Options": "nosniff",
+            }
+            if size:
+                headers["Vary"] = "Accept"
+
+            if is_not_modified(req, headers["ETag"]):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+            media_type = media_type or image.media_type
+            if "range" not in req.headers:
+                content = await read_small_image(location_file, image.digest)
+                if content is not None:
+                    return Response(content, media_type=media_type, headers=headers)
+            # FileResponse streams large images and answers Range requests
+            return FileResponse(location_file, media_type=media_type, headers=headers)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User profile image not found"
@@ -320,20 +381,26 @@ async def update_user_profile_image(
         if user_id == "me":
             user_id = session.user_id
 
-        location_file = await user_model.create_dir_if_not_exists(user_id, file)
+        image = await user_model.create_dir_if_not_exists(user_id, file)
 
-        if location_file:
+        if image:
             return {
                 "message": "Profile image updated successfully",
-                "profile_image": location_file,
+                "profile_image": image.location,
+                "profile_image_url": f"{router.prefix}/{user_id}/profile-image?v={image.version}",
                 # "status": 200
             }
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update user profile image"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
         )
     except HTTPException as http_ex:
         raise http_ex
+    except UploadTooLarge as e:
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        ) from e
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -357,7 +424,7 @@ async def delete_user_account_completely(
         user_id = req.session.get("id")
         await clear_session(req)
 
-    if user_model.delete_user(user_id):
+    if await user_model.delete_user(user_id):
         return {
             "message": "User account has been deleted successfully",
         }
@@ -368,7 +435,49 @@ async def delete_user_account_completely(
     )
 
 
+@router.delete("/{user_id}/sessions")
+async def revoke_user_sessions(
+    user_id: Annotated[
+        Union[str, int], Path(
+            title="The ID of the user to log out everywhere.",
+            description="This will end every session of the user, on every device.",
+            examples=[{"user_id": 19}, {"user_id": "me"}]
+        )
+    ],
+    req: Request
+) -> dict:
+    """Log a user out of every session, only the user or an admin can"""
+    current_user_id = req.session.get("id")
+
+    if current_user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not logged in"
+        )
+    if isinstance(user_id, str) and user_id == "me":
+        user_id = current_user_id
+    if not str(user_id).isdigit():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid user id: {user_id}"
+        )
+    if int(user_id) != current_user_id and not is_admin(req.session):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only revoke your own sessions"
+        )
+    if int(user_id) == current_user_id:
+        await clear_session(req)
+
+    return {
+        "message": "User sessions have been revoked successfully",
+        "revoked": await user_model.revoke_sessions(int(user_id)),
+    }
+
+
 @router.delete("/logout")
-async def logout_user(_: None = Depends(clear_session)):
+async def logout_user(req: Request):
     """Logout user"""
+    user_model.forget_session(req.session.get("session_id"))
+    await clear_session(req)
     return RedirectResponse(url="/login", status_code=303)
@@ -0,0 +1,203 @@
+"""assets.py"""
+
+import gzip
+import json
+import posixpath
+from hashlib import sha256
+from mimetypes import guess_type
+from os import fdopen, makedirs, path, remove, replace, walk
+from re import compile as re_compile
+from tempfile import mkstemp
+from typing import Callable, Optional
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+from api.config import STATIC_DIR, STATIC_BUILD_DIR, STATIC_COMPRESS_MIN_SIZE
+from api.utils.http_cache import make_etag, accepted_encodings
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip siblings are always generated
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+COMPRESSIBLE = {".css", ".js", ".svg", ".ttf", ".otf", ".eot", ".json", ".txt", ".html", ".map"}
+CSS_URL_REGEX = re_compile(r"""url\((["']?)([^"')]+)\1\)""")
+
+# Content-Encoding -> (sibling suffix, compressor), in order of preference
+COMPRESSORS: dict[str, tuple[str, Callable[[bytes], bytes]]] = {}
+if brotli is not None:
+    COMPRESSORS["br"] = (".br", lambda data: brotli.compress(data, quality=11))
+COMPRESSORS["gzip"] = (".gz", lambda data: gzip.compress(data, 9, mtime=0))
+
+
+def write_atomic(location: str, data: bytes):
+    """
+    Write a file through a uniquely named temporary sibling so readers never
+    see a partial file and concurrent writers never share a temporary file
+    """
+    directory, name = path.split(location)
+    makedirs(directory, exist_ok=True)
+    descriptor, temporary = mkstemp(dir=directory, prefix=f".{name}.", suffix=".part")
+    try:
+        with fdopen(descriptor, "wb") as f:
+            f.write(data)
+        replace(temporary, location)
+    except BaseException:
+        remove(temporary)
+        raise
+
+
+class StaticAssets():
+    """
+    Manifest of the fingerprinted static files.
+
+    `build` names every file under `directory` after its content hash
+    (css/style.css -> css/style.<hash>.css), rewrites the url() references of
+    the stylesheets to the fingerprinted names and writes gzip (and brotli
+    when installed) siblings of the text assets into `build_directory`.
+    """
+    def __init__(
+        self,
+        directory: str = STATIC_DIR,
+        build_directory: str = STATIC_BUILD_DIR,
+        prefix: str = "/static"
+    ):
+        self.directory = directory
+        self.build_directory = build_directory
+        self.prefix = prefix
+        self.manifest: dict[str, str] = {}
+        self.files: dict[str, str] = {}
+        self.encodings: dict[str, dict[str, str]] = {}
+
+    def url(self, name: str) -> str:
+        """URL of a static file, fingerprinted once the assets are built"""
+        return f"{self.prefix}/{self.manifest.get(name, name)}"
+
+    def sources(self) -> list[str]:
+        """Relative paths of the static files, stylesheets last"""
+        names = []
+        for root, dirs, files in walk(self.directory):
+            dirs[:] = [name for name in dirs if not name.startswith(".")]
+            for name in files:
+                if not name.startswith("."):
+                    relative = path.relpath(path.join(root, name), self.directory)
+                    names.append(relative.replace(path.sep, "/"))
+        # stylesheets reference the other files, so those are fingerprinted first
+        return sorted(names, key=lambda name: (name.endswith(".css"), name))
+
+    def rewrite_css(self, name: str, data: bytes, manifest: dict[str, str]) -> bytes:
+        """Point the relative url() references of a stylesheet to fingerprinted files"""
+        folder = posixpath.dirname(name)
+
+        def fingerprint(found) -> str:
+            quote, reference = found.group(1), found.group(2)
+            target, _, suffix = reference.partition("?")
+            target, hash_sign, fragment = target.partition("#")
+            if ":" in target or target.startswith("/"):
+                return found.group(0)
+            resolved = posixpath.normpath(posixpath.join(folder, target))
+            if resolved not in manifest:
+                return found.group(0)
+            hashed = posixpath.relpath(manifest[resolved], folder or ".")
+            rebuilt = hashed + (f"?{suffix}" if suffix else "") + hash_sign + fragment
+            return f"url({quote}{rebuilt}{quote})"
+
+        text = data.decode("utf-8")
+        return CSS_URL_REGEX.sub(fingerprint, text).encode("utf-8")
+
+    def build(self) -> int:
+        """Fingerprint and precompress the static files, return the number of files"""
+        manifest: dict[str, str] = {}
+        files: dict[str, str] = {}
+        encodings: dict[str, dict[str, str]] = {}
+
+        for name in self.sources():
+            source = path.join(self.directory, name)
+            with open(source, "rb") as f:
+                original = f.read()
+            data = self.rewrite_css(name, original, manifest) if name.endswith(".css") else original
+
+            stem, extension = posixpath.splitext(name)
+            hashed = f"{stem}.{sha256(data).hexdigest()[:12]}{extension}"
+            manifest[name] = hashed
+            files[hashed] = source
+
+            built = path.join(self.build_directory, hashed)
+            if data != original:
+                if not path.exists(built):
+                    write_atomic(built, data)
+                files[hashed] = built
+
+            encodings[hashed] = {}
+            if extension.lower() not in COMPRESSIBLE or len(data) < STATIC_COMPRESS_MIN_SIZE:
+                continue
+            for encoding, (suffix, compress) in COMPRESSORS.items():
+                sibling = built + suffix
+                if not path.exists(sibling):
+                    compressed = compress(data)
+                    if len(compressed) >= len(data):
+                        continue
+                    write_atomic(sibling, compressed)
+                encodings[hashed][encoding] = sibling
+
+        self.manifest, self.files, self.encodings = manifest, files, encodings
+        write_atomic(
+            path.join(self.build_directory, "manifest.json"),
+            json.dumps(manifest, indent=2, sort_keys=True).encode()
+        )
+        return len(manifest)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles serving the fingerprinted URLs of `assets` with immutable
+    caching, from the precompressed sibling matching Accept-Encoding when
+    there is one. Plain URLs are served as usual.
+    """
+    def __init__(self, *args, assets: StaticAssets, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.assets = assets
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        hashed = path.replace("\\", "/")
+        source = self.assets.files.get(hashed)
+        if source is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+
+        request_headers = Headers(scope=scope)
+        location, encoding = self.negotiate(hashed, request_headers.get("accept-encoding", ""))
+        # fingerprinted names are content addressed, no need to stat the file for validators
+        headers = {"Cache-Control": IMMUTABLE, "ETag": make_etag((hashed, encoding))}
+        if self.assets.encodings.get(hashed):
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        response = FileResponse(
+            location or source,
+            media_type=guess_type(hashed)[0] or "application/octet-stream",
+            headers=headers
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def negotiate(self, hashed: str, accept_encoding: str) -> tuple[Optional[str], Optional[str]]:
+        """Return (sibling path, encoding) of the preferred accepted encoding"""
+        siblings = self.assets.encodings.get(hashed)
+        if not siblings:
+            return None, None
+        accepted = accepted_encodings(accept_encoding)
+        for encoding, sibling in siblings.items():
+            if encoding in accepted:
+                return sibling, encoding
+        return None, None
+
+
+static_assets = StaticAssets()
+
+
+if __name__ == "__main__":
+    print(f"Built {static_assets.build()} static files into {static_assets.build_directory}")
@@ -0,0 +1,208 @@
+"""cache.py"""
+
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache():
+    """
+    Bounded in-process cache, least recently used entries are evicted first
+    and entries expire `ttl` seconds after they were set.
+
+    With `max_bytes` the cache is also bounded by the summed `weigh(value)`
+    of its entries (len() by default, meant for bytes values).
+    """
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = 300.0,
+        max_bytes: Optional[int] = None,
+        weigh: Callable[[Any], int] = len
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.weigh = weigh
+        self.nbytes = 0
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and not self.expired(entry)
+
+    def expired(self, entry: tuple[float, Any]) -> bool:
+        """Check if an entry outlived its ttl"""
+        return self.ttl is not None and entry[0] <= monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value of key, or default on a miss"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        if self.expired(entry):
+            self.delete(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        """Cache a value, evicting the least recently used entries if full"""
+        size = self.weigh(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.delete(key)
+            return
+
+        self.delete(key)
+        expires_at = monotonic() + self.ttl if self.ttl is not None else 0.0
+        self.entries[key] = (expires_at, value)
+        self.nbytes += size
+
+        while len(self.entries) > self.maxsize or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes
+        ):
+            _, (_, evicted) = self.entries.popitem(last=False)
+            if self.max_bytes is not None:
+                self.nbytes -= self.weigh(evicted)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """Remove a key, return True if it was cached"""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        if self.max_bytes is not None:
+            self.nbytes -= self.weigh(entry[1])
+        return True
+
+    def clear(self):
+        """Remove every entry, the counters are kept"""
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self) -> dict:
+        """Return the size and hit/miss/eviction counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class LocalCacheBackend():
+    """
+    In-process cache backend for bytes values, bounded by their total size.
+
+    Counters are bounded too, the least recently used are dropped first.
+    Every increment takes the next value of one sequence shared by all
+    counters and a dropped counter reads as the sequence at the time of the
+    drop, so a counter never goes back to a value it had before.
+    """
+    def __init__(
+        self, max_bytes: int = 16 * 1024 * 1024, ttl: Optional[float] = 300.0,
+        max_counters: int = 65536
+    ):
+        self.cache = TTLCache(maxsize=max_bytes, ttl=ttl, max_bytes=max_bytes)
+        self.max_counters = max_counters
+        self.counters: OrderedDict[str, int] = OrderedDict()
+        self.sequence = 0
+        self.floor = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return the cached bytes of key or None"""
+        return self.cache.get(key)
+
+    async def set(self, key: str, value: bytes):
+        """Cache bytes under key"""
+        self.cache.set(key, value)
+
+    async def delete(self, *keys: str):
+        """Remove keys from the cache"""
+        for key in keys:
+            self.cache.delete(key)
+
+    async def incr(self, key: str) -> int:
+        """Move a counter to a value it never had, dropping the least recently used ones"""
+        self.sequence += 1
+        self.counters[key] = self.sequence
+        self.counters.move_to_end(key)
+        while len(self.counters) > self.max_counters:
+            self.counters.popitem(last=False)
+            self.floor = self.sequence
+        return self.sequence
+
+    async def counter(self, key: str) -> int:
+        """Return the value of a counter"""
+        value = self.counters.get(key)
+        if value is None:
+            return self.floor
+        self.counters.move_to_end(key)
+        return value
+
+    def stats(self) -> dict:
+        """Return the cache statistics"""
+        return {"backend": "local", **self.cache.stats(), "counters": len(self.counters)}
+
+
+class SharedCacheBackend():
+    """
+    Cache backend shared between workers on a redis-like asyncio client
+    (get, set with ex, delete, incr), e.g. redis.asyncio.Redis.
+    """
+    def __init__(self, client, ttl: Optional[float] = 300.0, prefix: str = "note-web:"):
+        self.client = client
+        self.ttl = int(ttl) if ttl else None
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return the cached bytes of key or None"""
+        value = await self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: bytes):
+        """Cache bytes under key"""
+        await self.client.set(self.prefix + key, value, ex=self.ttl)
+
+    async def delete(self, *keys: str):
+        """Remove keys from the cache"""
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+    async def incr(self, key: str) -> int:
+        """Increment a counter"""
+        return int(await self.client.incr(self.prefix + key))
+
+    async def counter(self, key: str) -> int:
+        """Return the value of a counter"""
+        return int(await self.client.get(self.prefix + key) or 0)
+
+    def stats(self) -> dict:
+        """Return the cache statistics"""
+        return {"backend": "shared", "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
@@ -0,0 +1,203 @@
+"""helpers.py"""
+
+import csv
+import json
+import zlib
+from codecs import getincrementaldecoder
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from typing import AsyncIterator, Optional, Sequence, Union
+from sqlalchemy import Select, DateTime, and_, or_
+from api.config import IMPORT_MAX_RECORD_LENGTH
+
+DEFAULT_PAGE_SIZE = 10
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Encode the key values of the last row into an opaque cursor"""
+    payload = json.dumps(
+        [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        separators=(",", ":")
+    )
+    return urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Optional[Sequence] = None) -> list:
+    """Decode an opaque cursor back into the key values of `columns`"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+    if not isinstance(values, list) or (columns is not None and len(values) != len(columns)):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+    if columns is None:
+        return values
+
+    try:
+        return [decode_key(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def decode_key(column, value):
+    """
+    Check a decoded key value against the type of its column (an int for an
+    id, an ISO datetime string for a DateTime), values of another type must
+    not reach the seek query
+    """
+    if isinstance(column.type, DateTime):
+        if not isinstance(value, str):
+            raise TypeError(f"{column.key} must be an ISO datetime")
+        return datetime.fromisoformat(value)
+
+    python_type = column.type.python_type
+    if isinstance(value, bool) or not isinstance(value, python_type):
+        raise TypeError(f"{column.key} must be {python_type.__name__}")
+    return value
+
+
+def keyset_paginate(
+    stmt: Select,
+    columns: Sequence,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    descending: bool = False
+) -> Select:
+    """
+    Order `stmt` by `columns` and seek past the row encoded in `cursor`.
+
+    One extra row is selected so `next_page` can tell if there is more data.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        conditions = []
+        for i, column in enumerate(columns):
+            seek = column < values[i] if descending else column > values[i]
+            conditions.append(and_(*[columns[j] == values[j] for j in range(i)], seek))
+        stmt = stmt.where(or_(*conditions))
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    return stmt.order_by(*order).limit((limit or DEFAULT_PAGE_SIZE) + 1)
+
+
+def next_page(rows: Sequence, columns: Sequence, limit: Optional[int] = None) -> tuple:
+    """Split the extra row off `rows` and return (page, next_cursor)"""
+    limit = limit or DEFAULT_PAGE_SIZE
+    if len(rows) <= limit:
+        return list(rows), None
+
+    page = list(rows[:limit])
+    last = page[-1]
+    return page, encode_cursor([getattr(last, column.key) for column in columns])
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Gzip an async stream of bytes chunk by chunk"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class RecordTooLong(ValueError):
+    """A line or CSV record of an import is longer than the limit"""
+
+
+async def iter_lines(
+    chunks: AsyncIterator[bytes], encoding: str = "utf-8",
+    max_length: int = IMPORT_MAX_RECORD_LENGTH
+) -> AsyncIterator[str]:
+    """
+    Split an async stream of bytes into text lines, without the line ending.
+    Raise RecordTooLong instead of buffering a line past `max_length`.
+    """
+    decoder = getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            if len(line) > max_length:
+                raise RecordTooLong(f"Line is longer than {max_length} characters")
+            yield line.rstrip("\r")
+        if len(pending) > max_length:
+            raise RecordTooLong(f"Line is longer than {max_length} characters")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_csv_records(
+    lines: AsyncIterator[str], max_length: int = IMPORT_MAX_RECORD_LENGTH
+) -> AsyncIterator[list[str]]:
+    """
+    Parse CSV records from text lines, quoted fields may span several lines.
+    Raise RecordTooLong instead of buffering a record past `max_length`, so
+    an unterminated quote does not pull the rest of the upload into memory.
+    """
+    record = ""
+    async for line in lines:
+        record = f"{record}\n{line}" if record else line
+        if len(record) > max_length:
+            raise RecordTooLong(f"Record is longer than {max_length} characters")
+        if record.count('"') % 2:
+            continue
+        if record:
+            yield next(csv.reader([record]))
+        record = ""
+    if record:
+        yield next(csv.reader([record]))
+
+
+async def iter_ndjson_rows(
+    chunks: AsyncIterator[bytes]
+) -> AsyncIterator[tuple[int, Union[dict, str]]]:
+    """
+    Yield (row number, object) for each NDJSON line, or (row number, error message).
+    A line over the length limit is reported as the last row, the rest of the
+    body is not read.
+    """
+    number = 0
+    try:
+        async for line in iter_lines(chunks):
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, f"Invalid JSON: {e}"
+                continue
+            yield number, row if isinstance(row, dict) else "Expected a JSON object"
+    except RecordTooLong as e:
+        yield number + 1, str(e)
+
+
+async def iter_csv_rows(
+    chunks: AsyncIterator[bytes]
+) -> AsyncIterator[tuple[int, Union[dict, str]]]:
+    """
+    Yield (row number, dict) for each CSV record after the header row, or
+    (row number, error message). A record over the length limit (typically an
+    unterminated quote) is reported as the last row, the rest of the body is
+    not read.
+    """
+    header = None
+    number = 0
+    try:
+        async for record in iter_csv_records(iter_lines(chunks)):
+            if header is None:
+                header = [name.strip() for name in record]
+                continue
+            number += 1
+            if len(record) != len(header):
+                yield number, f"Expected {len(header)} fields, got {len(record)}"
+                continue
+            yield number, {name: value for name, value in zip(header, record) if value != ""}
+    except RecordTooLong as e:
+        yield number + 1, str(e)
@@ -0,0 +1,66 @@
+"""http_cache.py"""
+
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from hashlib import blake2b
+from typing import Iterable, Optional
+from fastapi import Request
+
+
+def make_etag(parts: Iterable, weak: bool = False) -> str:
+    """Build an ETag from the string form of `parts`"""
+    digest = blake2b(digest_size=12)
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"|")
+    return f'{"W/" if weak else ""}"{digest.hexdigest()}"'
+
+
+def http_date(value: Optional[datetime]) -> Optional[str]:
+    """Format a datetime as an HTTP date, naive datetimes are taken as UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[str] = None) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when no ETag was sent"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # weak comparison, as required for If-None-Match
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag.removeprefix("W/") in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def is_conditional(request: Request) -> bool:
+    """Check if the request carries a validator worth checking before loading data"""
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """Parse the codings of an Accept-Encoding header, those with q=0 excluded"""
+    encodings = set()
+    for item in header.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.replace(" ", "").startswith("q="):
+                try:
+                    quality = float(param.split("=", 1)[1])
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            encodings.add(coding.lower())
+    return encodings
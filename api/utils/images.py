@@ -0,0 +1,215 @@
+"""images.py"""
+
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob, escape
+from hashlib import sha256
+from io import BytesIO
+from os import path, remove
+from typing import NamedTuple, Optional
+from anyio import Path as AsyncPath, to_thread
+from api.config import PROFILE_IMAGE_SIZES, IMAGE_WORKERS, IMAGE_CACHE_MAX_BYTES,\
+    IMAGE_CACHE_ITEM_MAX_BYTES
+from api.utils.assets import write_atomic
+from api.utils.cache import TTLCache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, without it only the original image is served
+    Image = ImageOps = None
+
+# format -> (file extension, media type)
+VARIANT_FORMATS = {
+    "webp": ("webp", "image/webp"),
+    "jpeg": ("jpg", "image/jpeg"),
+}
+
+# leading bytes -> media type, checked in order
+SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+UNKNOWN_MEDIA_TYPE = "application/octet-stream"
+
+executor: Optional[ProcessPoolExecutor] = None
+
+# (path, digest) -> bytes of the small images, the digest keeps replaced files apart
+image_bytes = TTLCache(maxsize=4096, ttl=None, max_bytes=IMAGE_CACHE_MAX_BYTES)
+
+
+class ImageFile(NamedTuple):
+    """A stored image with the metadata recorded at upload, its variants included"""
+    location: str
+    media_type: str
+    digest: str
+    size: int
+    variants: tuple[str, ...] = ()
+
+    @property
+    def version(self) -> str:
+        """Short content hash, used as the `v` query of immutable URLs"""
+        return self.digest[:16]
+
+
+def sniff_media_type(head: bytes) -> str:
+    """Detect the media type of an image from its first bytes"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, media_type in SIGNATURES:
+        if head.startswith(signature):
+            return media_type
+    return UNKNOWN_MEDIA_TYPE
+
+
+def metadata_path(location: str) -> str:
+    """Path of the sidecar file holding the metadata of an image"""
+    return f"{path.splitext(location)[0]}.meta.json"
+
+
+async def write_metadata(image: ImageFile):
+    """Store the metadata of an image in its sidecar file"""
+    data = json.dumps(image._asdict()).encode()
+    await to_thread.run_sync(write_atomic, metadata_path(image.location), data)
+
+
+async def read_metadata(location: str) -> Optional[ImageFile]:
+    """
+    Load the metadata of an image from its sidecar, rebuilding it from the
+    files for images uploaded before sidecars (or their variants list)
+    existed. None if the file is gone.
+    """
+    try:
+        metadata = json.loads(await AsyncPath(metadata_path(location)).read_text())
+        image = ImageFile(**{**metadata, "variants": tuple(metadata.get("variants", ()))})
+        if image.location == location and "variants" in metadata:
+            return image
+    except (OSError, ValueError, TypeError):
+        pass
+
+    try:
+        data = await AsyncPath(location).read_bytes()
+    except OSError:
+        return None
+    image = ImageFile(
+        location, sniff_media_type(data[:16]), sha256(data).hexdigest(), len(data),
+        tuple(await existing_variants(location))
+    )
+    await write_metadata(image)
+    return image
+
+
+async def read_small_image(location: str, digest: str) -> Optional[bytes]:
+    """
+    Return the bytes of an image from the in-memory cache, loading it if it is
+    no larger than IMAGE_CACHE_ITEM_MAX_BYTES. None for large images.
+    """
+    key = (location, digest)
+    data = image_bytes.get(key)
+    if data is not None:
+        return data
+
+    file = AsyncPath(location)
+    if (await file.stat()).st_size > IMAGE_CACHE_ITEM_MAX_BYTES:
+        return None
+    data = await file.read_bytes()
+    image_bytes.set(key, data)
+    return data
+
+
+def variants_enabled() -> bool:
+    """Check if variants can be generated, i.e. Pillow is installed"""
+    return Image is not None and bool(PROFILE_IMAGE_SIZES)
+
+
+def variant_path(source: str, size: int, fmt: str) -> str:
+    """Path of the `size` px `fmt` variant of a source image, next to it"""
+    stem = path.splitext(source)[0]
+    return f"{stem}_{size}.{VARIANT_FORMATS[fmt][0]}"
+
+
+def render_variants(source: str, sizes: tuple[int, ...]) -> list[str]:
+    """
+    Write the square variants of `source` in every size and format.
+
+    Runs in a worker process; stale variants of a previous upload are removed first.
+    """
+    for stale in glob(f"{escape(path.splitext(source)[0])}_*"):
+        remove(stale)
+
+    written = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for size in sizes:
+            thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+            for fmt in VARIANT_FORMATS:
+                location = variant_path(source, size, fmt)
+                variant = thumbnail if fmt == "webp" else thumbnail.convert("RGB")
+                buffer = BytesIO()
+                variant.save(buffer, format=fmt.upper(), quality=85)
+                write_atomic(location, buffer.getvalue())
+                written.append(location)
+    return written
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Return the image worker pool, started on first use"""
+    global executor  # pylint: disable=global-statement
+    if executor is None:
+        executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return executor
+
+
+async def generate_variants(source: str) -> list[str]:
+    """Render the variants of `source` in the worker pool, [] if it is not a readable image"""
+    if not variants_enabled():
+        return []
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            get_executor(), render_variants, source, PROFILE_IMAGE_SIZES
+        )
+    except (OSError, ValueError):
+        # PIL.UnidentifiedImageError is an OSError, the original is still served
+        return []
+
+
+async def existing_variants(source: str) -> list[str]:
+    """Variants of `source` found on disk, for images uploaded before they were recorded"""
+    return [
+        location for location in (
+            variant_path(source, size, fmt) for size in PROFILE_IMAGE_SIZES for fmt in VARIANT_FORMATS
+        ) if await AsyncPath(location).exists()
+    ]
+
+
+def select_variant(
+    image: ImageFile, size: Optional[int], accept: str = ""
+) -> tuple[str, Optional[str]]:
+    """
+    Return (path, media type) of the smallest recorded variant at least `size`
+    px wide, WebP when the client accepts it. Falls back to the original image.
+    """
+    if size is None:
+        return image.location, None
+
+    fits = [candidate for candidate in sorted(PROFILE_IMAGE_SIZES) if candidate >= size]
+    if not fits:
+        return image.location, None
+
+    for fmt in ("webp", "jpeg") if "image/webp" in accept else ("jpeg",):
+        location = variant_path(image.location, fits[0], fmt)
+        if location in image.variants:
+            return location, VARIANT_FORMATS[fmt][1]
+    return image.location, None
+
+
+def shutdown_executor():
+    """Stop the image worker pool"""
+    global executor  # pylint: disable=global-statement
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
@@ -0,0 +1,216 @@
+"""metrics.py"""
+
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from inspect import isasyncgenfunction, iscoroutinefunction
+from time import perf_counter
+from typing import Iterable, Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import Scope
+from api.config import METRICS_BUCKETS
+
+# request and model method of the code running, the labels of its queries
+current_scope: ContextVar[Optional[Scope]] = ContextVar("current_scope", default=None)
+current_caller: ContextVar[str] = ContextVar("current_caller", default="<none>")
+
+
+def route_label(scope: Optional[Scope]) -> str:
+    """
+    Path template of the route serving a request ("/api/notes/{field}"), so
+    the label count stays bounded; mounted apps (e.g. /static) have no route
+    and are labelled with their mount path.
+    """
+    if scope is None:
+        return "<none>"
+    return getattr(scope.get("route"), "path", None) or scope.get("root_path") or "<unmatched>"
+
+
+class Histogram():
+    """Bucket counts (made cumulative on export), sum and count of observed values"""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Count a value in the first bucket it fits"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def escape(value: str) -> str:
+    """Escape a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    """Render {name="value",...} for a sample line"""
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric():
+    """A labelled counter, gauge or histogram family"""
+    def __init__(
+        self, name: str, kind: str, description: str, labels: tuple[str, ...],
+        buckets: tuple[float, ...] = METRICS_BUCKETS
+    ):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.values: dict[tuple, float | Histogram] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        """Add to a counter or gauge"""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def observe(self, value: float, *labels):
+        """Record a value in a histogram"""
+        histogram = self.values.get(labels)
+        if histogram is None:
+            histogram = self.values[labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def export(self) -> Iterable[str]:
+        """Lines of the Prometheus text format"""
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, value in list(self.values.items()):
+            if not isinstance(value, Histogram):
+                yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+                continue
+            cumulative = 0
+            for bound, count in zip((*value.buckets, "+Inf"), value.counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {value.sum}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {value.count}"
+
+
+class Metrics():
+    """Registry of the request and database metrics"""
+    def __init__(self):
+        self.requests_in_flight = Metric(
+            "http_requests_in_flight", "gauge",
+            "Requests being served", ("method", "route")
+        )
+        self.requests = Metric(
+            "http_requests_total", "counter",
+            "Requests served by status code", ("method", "route", "status")
+        )
+        self.request_errors = Metric(
+            "http_request_errors_total", "counter",
+            "Requests that failed with a server error or an exception", ("method", "route")
+        )
+        self.request_duration = Metric(
+            "http_request_duration_seconds", "histogram",
+            "Time to serve a request, streamed body included", ("method", "route")
+        )
+        self.queries = Metric(
+            "db_queries_total", "counter",
+            "SQL statements executed", ("route", "caller", "operation")
+        )
+        self.query_duration = Metric(
+            "db_query_duration_seconds", "histogram",
+            "Time spent executing SQL statements", ("route", "caller")
+        )
+        # requests being served, by id, their route is only known once routed
+        self.active: dict[int, tuple[str, Scope]] = {}
+
+    def families(self) -> tuple[Metric, ...]:
+        """Every metric of the registry"""
+        return (
+            self.requests_in_flight, self.requests, self.request_errors, self.request_duration,
+            self.queries, self.query_duration,
+        )
+
+    def export(self) -> str:
+        """Render the metrics in the Prometheus text format"""
+        in_flight: dict[tuple, float] = {}
+        for method, scope in list(self.active.values()):
+            labels = (method, route_label(scope))
+            in_flight[labels] = in_flight.get(labels, 0) + 1
+        self.requests_in_flight.values = in_flight
+        return "\n".join(line for metric in self.families() for line in metric.export()) + "\n"
+
+
+metrics = Metrics()
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Count and time the statements of an engine, labelled with the current route and caller"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - conn.info["query_started_at"].pop()
+        route, caller = route_label(current_scope.get()), current_caller.get()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "-"
+        metrics.queries.inc(route, caller, operation)
+        metrics.query_duration.observe(elapsed, route, caller)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("query_started_at") \
+            if exception_context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def track_queries(cls):
+    """
+    Class decorator labelling the queries of every async method of a model
+    with "<Class>.<method>" (the innermost tracked method wins).
+    """
+    def tracked(func, name: str):
+        if isasyncgenfunction(func):
+            @wraps(func)
+            async def generator(*args, **kwargs):
+                iterator = func(*args, **kwargs)
+                try:
+                    while True:
+                        token = current_caller.set(name)
+                        try:
+                            item = await iterator.__anext__()
+                        except StopAsyncIteration:
+                            return
+                        finally:
+                            current_caller.reset(token)
+                        yield item
+                finally:
+                    await iterator.aclose()
+            return generator
+
+        @wraps(func)
+        async def coroutine(*args, **kwargs):
+            token = current_caller.set(name)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                current_caller.reset(token)
+        return coroutine
+
+    for attribute, value in list(vars(cls).items()):
+        if attribute.startswith("__"):
+            continue
+        wrapper = type(value) if isinstance(value, (staticmethod, classmethod)) else None
+        func = value.__func__ if wrapper else value
+        if iscoroutinefunction(func) or isasyncgenfunction(func):
+            tracked_func = tracked(func, f"{cls.__name__}.{attribute}")
+            setattr(cls, attribute, wrapper(tracked_func) if wrapper else tracked_func)
+    return cls
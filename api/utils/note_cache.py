@@ -0,0 +1,96 @@
+"""note_cache.py"""
+
+from typing import Any, Iterable, Optional
+from api.config import NOTE_CACHE_BACKEND, NOTE_CACHE_URL, NOTE_CACHE_MAX_BYTES, NOTE_CACHE_TTL
+from api.utils.cache import LocalCacheBackend, SharedCacheBackend
+from api.utils.serialization import dumps, loads
+
+
+class NoteCache():
+    """
+    Read-through cache of single notes and of per-user note lists.
+
+    Notes and lists are stored under a generation number (per note, per
+    user), so one increment invalidates a note or every cached page of a
+    user. Readers take the key before reading the database and set the
+    value under that same key: a value read before an invalidation lands
+    under the outdated generation and is never served.
+    """
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    @property
+    def enabled(self) -> bool:
+        """Check if a backend is configured"""
+        return self.backend is not None
+
+    @staticmethod
+    def note_generation_key(note_id: int) -> str:
+        """Cache key of the generation of a note"""
+        return f"note:{note_id}:generation"
+
+    @staticmethod
+    def generation_key(user_id: int) -> str:
+        """Cache key of the list generation of a user"""
+        return f"notes:user:{user_id}:generation"
+
+    async def note_key(self, note_id: int) -> Optional[str]:
+        """Cache key of a single note, None without a backend"""
+        if not self.enabled:
+            return None
+        generation = await self.backend.counter(self.note_generation_key(note_id))
+        return f"note:{note_id}:{generation}"
+
+    async def list_key(self, user_id: int, variant: str) -> Optional[str]:
+        """Cache key of one page of a user's notes, None without a backend"""
+        if not self.enabled:
+            return None
+        generation = await self.backend.counter(self.generation_key(user_id))
+        return f"notes:user:{user_id}:{generation}:{variant}"
+
+    async def get(self, key: Optional[str]) -> Any:
+        """Return the value cached under a note_key or list_key, or None"""
+        if key is None:
+            return None
+        value = await self.backend.get(key)
+        return loads(value) if value is not None else None
+
+    async def set(self, key: Optional[str], value: Any):
+        """Cache a value under the key taken before it was read"""
+        if key is not None:
+            await self.backend.set(key, dumps(value))
+
+    async def invalidate(self, user_id: Optional[int], note_ids: Iterable[int] = ()):
+        """Move the given notes and every cached list of their owner to a new generation"""
+        if not self.enabled:
+            return
+        for note_id in note_ids:
+            await self.backend.incr(self.note_generation_key(note_id))
+        if user_id is not None:
+            await self.backend.incr(self.generation_key(user_id))
+
+    def stats(self) -> dict:
+        """Return the backend statistics"""
+        if not self.enabled:
+            return {"backend": None}
+        return self.backend.stats()
+
+
+def create_backend(name: str = NOTE_CACHE_BACKEND):
+    """Create the configured cache backend"""
+    match name:
+        case "local":
+            return LocalCacheBackend(NOTE_CACHE_MAX_BYTES, NOTE_CACHE_TTL)
+        case "shared":
+            try:
+                from redis.asyncio import Redis  # pylint: disable=import-outside-toplevel
+            except ImportError as e:
+                raise RuntimeError(
+                    "NOTE_CACHE_BACKEND=shared requires the 'redis' package"
+                ) from e
+            return SharedCacheBackend(Redis.from_url(NOTE_CACHE_URL), NOTE_CACHE_TTL)
+        case _:
+            return None
+
+
+note_cache = NoteCache(create_backend())
@@ -0,0 +1,71 @@
+"""page_cache.py"""
+
+from os import makedirs, path, walk
+from typing import Hashable, Optional
+from fastapi.responses import HTMLResponse
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+from api.config import PAGE_CACHE_SIZE, PAGE_CACHE_MAX_BYTES, TEMPLATES_AUTO_RELOAD,\
+    TEMPLATE_BYTECODE_DIR
+from api.utils.cache import TTLCache
+
+
+class PageCache():
+    """
+    Rendered template output keyed by template name and context.
+
+    Only for templates whose output depends on nothing but the context (no
+    `request`), with hashable context values. The Jinja environment gets a
+    bytecode cache so a restart skips compiling the templates; with
+    `auto_reload` (dev mode) any template file change drops the cached pages.
+    """
+    def __init__(
+        self,
+        templates: Jinja2Templates,
+        auto_reload: bool = TEMPLATES_AUTO_RELOAD,
+        bytecode_directory: Optional[str] = TEMPLATE_BYTECODE_DIR
+    ):
+        self.templates = templates
+        self.auto_reload = auto_reload
+        self.cache = TTLCache(PAGE_CACHE_SIZE, ttl=None, max_bytes=PAGE_CACHE_MAX_BYTES)
+        self.signature: Optional[tuple] = None
+
+        templates.env.auto_reload = auto_reload
+        if bytecode_directory:
+            makedirs(bytecode_directory, exist_ok=True)
+            templates.env.bytecode_cache = FileSystemBytecodeCache(bytecode_directory)
+
+    def templates_signature(self) -> tuple:
+        """Modification times of the template files"""
+        return tuple(sorted(
+            (path.join(root, name), path.getmtime(path.join(root, name)))
+            for directory in self.templates.env.loader.searchpath
+            for root, _, files in walk(directory) for name in files
+        ))
+
+    def render(self, name: str, context: dict) -> bytes:
+        """Return the rendered bytes of a template, rendering it on a cache miss"""
+        if self.auto_reload:
+            signature = self.templates_signature()
+            if signature != self.signature:
+                self.cache.clear()
+                self.signature = signature
+
+        key: Hashable = (name, tuple(sorted(context.items())))
+        body = self.cache.get(key)
+        if body is None:
+            body = self.templates.get_template(name).render(context).encode()
+            self.cache.set(key, body)
+        return body
+
+    def response(self, name: str, context: dict, status_code: int = 200) -> HTMLResponse:
+        """Render a template through the cache into an HTMLResponse"""
+        return HTMLResponse(self.render(name, context), status_code=status_code)
+
+    def clear(self):
+        """Drop every rendered page, e.g. after the static asset URLs changed"""
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        """Return the page cache statistics"""
+        return self.cache.stats()
@@ -0,0 +1,170 @@
+"""passwords.py"""
+
+import asyncio
+import hashlib
+import hmac
+from base64 import b64decode, b64encode
+from concurrent.futures import ThreadPoolExecutor
+from os import urandom
+from time import perf_counter
+from typing import Callable, Optional
+from api.config import PASSWORD_HASH_ALGORITHM, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE,\
+    SCRYPT_N, SCRYPT_R, SCRYPT_P, PBKDF2_ITERATIONS
+
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+
+class HasherBusy(RuntimeError):
+    """Raised when too many hash calls are already waiting for a worker"""
+
+
+def b64(data: bytes) -> str:
+    """Unpadded base64 of bytes"""
+    return b64encode(data).decode().rstrip("=")
+
+
+def unb64(data: str) -> bytes:
+    """Decode unpadded base64"""
+    return b64decode(data + "=" * (-len(data) % 4))
+
+
+def scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    """Derive a key with scrypt"""
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024,
+        dklen=KEY_SIZE
+    )
+
+
+def pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    """Derive a key with PBKDF2-HMAC-SHA256"""
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations, KEY_SIZE)
+
+
+class PasswordHasher():
+    """
+    Password hashing with a tunable KDF (scrypt or pbkdf2_sha256) off the event loop.
+
+    The KDF runs in a bounded thread pool (hashlib releases the GIL while it
+    works), so a burst of logins uses at most `workers` cores and every other
+    route keeps being served. At most `max_queue` calls wait for a worker,
+    more raise HasherBusy instead of piling up.
+
+    Hashes are stored as "scrypt$n$r$p$salt$key" or "pbkdf2_sha256$iterations$salt$key";
+    anything else is a legacy hash, upgraded on the next successful login.
+    """
+    def __init__(
+        self,
+        algorithm: str = PASSWORD_HASH_ALGORITHM,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_queue: int = PASSWORD_HASH_MAX_QUEUE
+    ):
+        if algorithm not in ("scrypt", "pbkdf2_sha256"):
+            raise ValueError(f"Unknown password hash algorithm: {algorithm}")
+        self.algorithm = algorithm
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.waiting = 0
+        self.calls = 0
+        self.rejected = 0
+        self.queue_time = 0.0
+        self.max_queue_time = 0.0
+        self.hash_time = 0.0
+
+    def encode(self, password: str, salt: bytes) -> str:
+        """Hash a password with the current algorithm and parameters (blocking)"""
+        if self.algorithm == "scrypt":
+            key = scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+            return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${b64(salt)}${b64(key)}"
+        key = pbkdf2(password, salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${b64(salt)}${b64(key)}"
+
+    @staticmethod
+    def check(password: str, encoded: str) -> bool:
+        """Check a password against a stored hash (blocking)"""
+        algorithm, _, params = encoded.partition("$")
+        try:
+            match algorithm:
+                case "scrypt":
+                    n, r, p, salt, key = params.split("$")
+                    derived = scrypt(password, unb64(salt), int(n), int(r), int(p))
+                case "pbkdf2_sha256":
+                    iterations, salt, key = params.split("$")
+                    derived = pbkdf2(password, unb64(salt), int(iterations))
+                case _:
+                    # legacy placeholder hashes
+                    return hmac.compare_digest(encoded.encode(), f"fake{password}".encode())
+        except ValueError:
+            return False
+        return hmac.compare_digest(derived, unb64(key))
+
+    def needs_rehash(self, encoded: str) -> bool:
+        """Check if a hash is legacy or was made with other parameters"""
+        if self.algorithm == "scrypt":
+            prefix = f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$"
+        else:
+            prefix = f"pbkdf2_sha256${PBKDF2_ITERATIONS}$"
+        return not encoded.startswith(prefix)
+
+    async def run(self, func: Callable, *args):
+        """Run a blocking KDF call in the pool, waiting for a free worker"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash")
+            self.semaphore = asyncio.Semaphore(self.workers)
+
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HasherBusy("Too many password checks in progress, try again later")
+
+        queued_at = perf_counter()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            started_at = perf_counter()
+            waited = started_at - queued_at
+            self.queue_time += waited
+            self.max_queue_time = max(self.max_queue_time, waited)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.calls += 1
+            self.hash_time += perf_counter() - started_at
+            self.semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        """Hash a password with a new random salt"""
+        return await self.run(self.encode, password, urandom(SALT_SIZE))
+
+    async def verify(self, password: str, encoded: Optional[str]) -> bool:
+        """Check a password against a stored hash"""
+        if not encoded:
+            return False
+        return await self.run(self.check, password, encoded)
+
+    def shutdown(self):
+        """Stop the worker threads"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self) -> dict:
+        """Return the call counters and the queue/hash times in milliseconds"""
+        return {
+            "algorithm": self.algorithm,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "avg_queue_ms": round(self.queue_time / self.calls * 1000, 3) if self.calls else 0.0,
+            "max_queue_ms": round(self.max_queue_time * 1000, 3),
+            "avg_hash_ms": round(self.hash_time / self.calls * 1000, 3) if self.calls else 0.0,
+        }
+
+
+password_hasher = PasswordHasher()
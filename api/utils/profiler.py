@@ -0,0 +1,189 @@
+"""profiler.py"""
+
+import logging
+from collections import deque
+from contextvars import ContextVar
+from re import compile as re_compile
+from time import perf_counter
+from typing import Any, NamedTuple, Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from api.config import QUERY_PROFILER_SLOW_MS, QUERY_PROFILER_REPEAT_THRESHOLD,\
+    QUERY_PROFILER_HISTORY, QUERY_PROFILER_PARAMETERS
+from api.utils.metrics import current_caller
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+)"
+IN_LIST_REGEX = re_compile(rf"\(\s*{PLACEHOLDER}(?:\s*,\s*{PLACEHOLDER})+\s*\)")
+WHITESPACE_REGEX = re_compile(r"\s+")
+PARAMETERS_MAX_LENGTH = 200
+
+
+def statement_shape(statement: str) -> str:
+    """Statement with its whitespace and IN (?, ?, ...) lists collapsed"""
+    return IN_LIST_REGEX.sub("(?, ...)", WHITESPACE_REGEX.sub(" ", statement).strip())
+
+
+def format_parameters(parameters: Any) -> Optional[str]:
+    """Truncated repr of the bound parameters of a statement"""
+    return None if parameters is None else repr(parameters)[:PARAMETERS_MAX_LENGTH]
+
+
+class ProfiledQuery(NamedTuple):
+    """
+    One statement executed during a profiled request, its parameters are only
+    held until the profile is analysed (for EXPLAIN) unless they are captured
+    """
+    statement: str
+    parameters: Any
+    duration: float
+    caller: str
+
+
+class QueryProfile():
+    """The statements executed while serving one request"""
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = perf_counter()
+        self.duration = 0.0
+        self.queries: list[ProfiledQuery] = []
+
+    @property
+    def db_time(self) -> float:
+        """Seconds spent executing statements"""
+        return sum(query.duration for query in self.queries)
+
+    def repeated(self, threshold: int = QUERY_PROFILER_REPEAT_THRESHOLD) -> dict[str, int]:
+        """Statement shapes executed at least `threshold` times, possible N+1 patterns"""
+        counts: dict[str, int] = {}
+        for query in self.queries:
+            shape = statement_shape(query.statement)
+            counts[shape] = counts.get(shape, 0) + 1
+        return {shape: count for shape, count in counts.items() if count >= threshold}
+
+    def slow(self, threshold_ms: float = QUERY_PROFILER_SLOW_MS) -> list[ProfiledQuery]:
+        """Statements that took longer than `threshold_ms`"""
+        return [query for query in self.queries if query.duration * 1000 >= threshold_ms]
+
+    def by_caller(self) -> dict[str, tuple[int, float]]:
+        """(statement count, seconds) per model method"""
+        callers: dict[str, tuple[int, float]] = {}
+        for query in self.queries:
+            count, duration = callers.get(query.caller, (0, 0.0))
+            callers[query.caller] = (count + 1, duration + query.duration)
+        return callers
+
+    def server_timing(self) -> str:
+        """Server-Timing header value with the database time and its breakdown per method"""
+        metrics = [f'db;dur={self.db_time * 1000:.2f};desc="{len(self.queries)} queries"']
+        metrics.extend(
+            f'db.{caller.strip("<>")};dur={duration * 1000:.2f};desc="{count} queries"'
+            for caller, (count, duration) in self.by_caller().items()
+        )
+        return ", ".join(metrics)
+
+    def report(self, parameters: bool = QUERY_PROFILER_PARAMETERS) -> dict:
+        """Summary of the profile with the shape of every statement, and its parameters if asked"""
+        return {
+            "method": self.method,
+            "path": self.path,
+            "duration_ms": round(self.duration * 1000, 3),
+            "db_time_ms": round(self.db_time * 1000, 3),
+            "repeated": self.repeated(),
+            "queries": [
+                {
+                    "statement": statement_shape(query.statement),
+                    **({"parameters": format_parameters(query.parameters)} if parameters else {}),
+                    "duration_ms": round(query.duration * 1000, 3),
+                    "caller": query.caller,
+                }
+                for query in self.queries
+            ],
+        }
+
+
+current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("current_profile", default=None)
+
+
+class QueryProfiler():
+    """
+    Collects the statements of the profiled requests, logs the possible N+1
+    patterns and the slow statements with their EXPLAIN plan, and keeps the
+    last `history` profiles for GET /status/query-profiles.
+
+    Only the statement shapes and timings are logged and kept, the bound
+    parameters (password hashes, session ids, emails) too with `parameters`.
+    Requests that are not profiled only pay for a ContextVar lookup per statement.
+    """
+    def __init__(
+        self, history: int = QUERY_PROFILER_HISTORY, parameters: bool = QUERY_PROFILER_PARAMETERS
+    ):
+        self.engine: Optional[AsyncEngine] = None
+        self.parameters = parameters
+        self.profiles: deque[dict] = deque(maxlen=history)
+
+    def instrument(self, engine: AsyncEngine):
+        """Record the statements of an engine into the current profile"""
+        if self.engine is engine:
+            return
+        self.engine = engine
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if current_profile.get() is not None:
+                conn.info.setdefault("profile_started_at", []).append(perf_counter())
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            profile = current_profile.get()
+            if profile is None or not conn.info.get("profile_started_at"):
+                return
+            duration = perf_counter() - conn.info["profile_started_at"].pop()
+            profile.queries.append(ProfiledQuery(
+                statement, None if executemany else parameters, duration, current_caller.get()
+            ))
+
+        @event.listens_for(sync_engine, "handle_error")
+        def handle_error(exception_context):
+            connection = exception_context.connection
+            if connection is not None and connection.info.get("profile_started_at"):
+                connection.info["profile_started_at"].pop()
+
+    async def explain(self, query: ProfiledQuery) -> list[str]:
+        """EXPLAIN plan of a read statement, one line per row"""
+        if self.engine is None or query.parameters is None or not query.statement.lstrip()\
+                .upper().startswith(("SELECT", "WITH")):
+            return []
+        prefix = "EXPLAIN QUERY PLAN " if self.engine.dialect.name == "sqlite" else "EXPLAIN "
+        try:
+            async with self.engine.connect() as conn:
+                rows = (await conn.exec_driver_sql(prefix + query.statement, query.parameters)).all()
+        except Exception as e:  # pylint: disable=broad-except
+            return [f"EXPLAIN failed: {e}"]
+        return [" | ".join(str(value) for value in row) for row in rows]
+
+    async def finish(self, profile: QueryProfile):
+        """Log the findings of a finished profile and keep its report"""
+        for shape, count in profile.repeated().items():
+            logger.warning(
+                "Possible N+1 on %s %s: %d x %s", profile.method, profile.path, count, shape
+            )
+        for query in profile.slow():
+            logger.warning(
+                "Slow query (%.1f ms) in %s on %s %s: %s%s\n%s",
+                query.duration * 1000, query.caller, profile.method, profile.path,
+                statement_shape(query.statement),
+                f" {format_parameters(query.parameters)}" if self.parameters else "",
+                "\n".join(await self.explain(query))
+            )
+        self.profiles.append(profile.report(self.parameters))
+
+    def stats(self) -> list[dict]:
+        """The last profiles, most recent first"""
+        return list(reversed(self.profiles))
+
+
+query_profiler = QueryProfiler()
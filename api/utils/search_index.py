@@ -0,0 +1,165 @@
+"""search_index.py"""
+
+from bisect import bisect_left, insort
+from collections import Counter
+from math import log
+from re import compile as re_compile
+from typing import Iterable, Optional
+
+TOKEN_REGEX = re_compile(r"\w+")
+FIELDS = ("title", "content")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    """Split a text into lowercase word tokens"""
+    if not text:
+        return []
+    return TOKEN_REGEX.findall(text.lower())
+
+
+class NoteSearchIndex():
+    """
+    In-memory inverted index over the note title and content.
+
+    Every field maps a token to per-user posting lists
+    {user_id: {note_id: term_frequency}}, so a search scoped to one user
+    only walks that user's postings.
+    """
+    def __init__(self):
+        self.postings: dict[str, dict[str, dict[int, dict[int, int]]]] = {
+            field: {} for field in FIELDS
+        }
+        self.vocabulary: dict[str, list[str]] = {field: [] for field in FIELDS}
+        self.documents: dict[str, dict[int, tuple[int, tuple[str, ...]]]] = {
+            field: {} for field in FIELDS
+        }
+        self.total_length: dict[str, int] = {field: 0 for field in FIELDS}
+        self.owners: dict[int, int] = {}
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self.owners)
+
+    def clear(self):
+        """Remove every note from the index"""
+        self.__init__()
+
+    def add(self, note_id: int, user_id: int, title: Optional[str], content: Optional[str]):
+        """Index a note, replacing the previous version if it was indexed"""
+        if note_id in self.owners:
+            self.remove(note_id)
+
+        self.owners[note_id] = user_id
+        for field, text in zip(FIELDS, (title, content)):
+            tokens = tokenize(text)
+            frequencies = Counter(tokens)
+            self.documents[field][note_id] = (len(tokens), tuple(frequencies))
+            self.total_length[field] += len(tokens)
+
+            postings = self.postings[field]
+            for token, frequency in frequencies.items():
+                if token not in postings:
+                    postings[token] = {}
+                    insort(self.vocabulary[field], token)
+                postings[token].setdefault(user_id, {})[note_id] = frequency
+
+    def add_note(self, note):
+        """Index a NoteDb object (or any object with the same attributes)"""
+        self.add(note.id, note.user_id, note.title, note.content)
+
+    def remove(self, note_id: int):
+        """Remove a note from the index"""
+        user_id = self.owners.pop(note_id, None)
+        if user_id is None:
+            return
+
+        for field in FIELDS:
+            length, tokens = self.documents[field].pop(note_id, (0, ()))
+            self.total_length[field] -= length
+
+            postings = self.postings[field]
+            for token in tokens:
+                user_postings = postings[token][user_id]
+                del user_postings[note_id]
+                if not user_postings:
+                    del postings[token][user_id]
+                if not postings[token]:
+                    del postings[token]
+                    vocabulary = self.vocabulary[field]
+                    del vocabulary[bisect_left(vocabulary, token)]
+
+    def expand(self, field: str, term: str, prefix: bool) -> list[str]:
+        """Return the indexed tokens matching a term, every token starting with it if prefix"""
+        if not prefix:
+            return [term] if term in self.postings[field] else []
+
+        vocabulary = self.vocabulary[field]
+        start = bisect_left(vocabulary, term)
+        end = bisect_left(vocabulary, term + "\U0010ffff")
+        return vocabulary[start:end]
+
+    def search(self, field: str, query: str, user_id: Optional[int] = None) -> list[int]:
+        """
+        Return the ids of the notes matching every term of the query, best first.
+
+        Terms ending with `*` match as prefixes, e.g. "meet* notes".
+        """
+        terms = []
+        for word in query.split():
+            prefix = word.endswith("*")
+            tokens = tokenize(word)
+            terms.extend((token, prefix and j == len(tokens) - 1) for j, token in enumerate(tokens))
+        if not terms:
+            return []
+
+        postings = self.postings[field]
+        matches = []
+        for term, prefix in terms:
+            frequencies: Counter = Counter()
+            for token in self.expand(field, term, prefix):
+                for notes in self.user_postings(postings[token], user_id):
+                    frequencies.update(notes)
+            if not frequencies:
+                return []
+            matches.append(frequencies)
+
+        matches.sort(key=len)
+        candidates = set(matches[0])
+        for frequencies in matches[1:]:
+            candidates.intersection_update(frequencies)
+            if not candidates:
+                return []
+
+        scores = self.score(field, candidates, matches)
+        return sorted(candidates, key=lambda note_id: (-scores[note_id], -note_id))
+
+    @staticmethod
+    def user_postings(users: dict, user_id: Optional[int]) -> Iterable:
+        """Yield the posting lists of one user or of every user"""
+        if user_id is None:
+            return users.values()
+        if user_id in users:
+            return (users[user_id],)
+        return ()
+
+    def score(self, field: str, candidates: set, matches: list[Counter]) -> dict[int, float]:
+        """BM25 score of the candidate notes"""
+        total = len(self.owners) or 1
+        average = (self.total_length[field] / total) or 1
+        documents = self.documents[field]
+        scores = dict.fromkeys(candidates, 0.0)
+
+        for frequencies in matches:
+            idf = log(1 + (total - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+            for note_id in candidates:
+                tf = frequencies[note_id]
+                norm = K1 * (1 - B + B * documents[note_id][0] / average)
+                scores[note_id] += idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+
+search_index = NoteSearchIndex()
@@ -0,0 +1,70 @@
+"""serialization.py"""
+
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Sequence
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard json module is the fallback
+    orjson = None
+
+
+def default(value: Any) -> Any:
+    """Encode the values json doesn't know, datetimes become ISO strings"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """Encode a value to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(value, default=default)
+    return json.dumps(value, separators=(",", ":"), default=default).encode()
+
+
+def loads(data: bytes) -> Any:
+    """Decode JSON bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def to_record(item: Any, fields: Sequence[str]) -> dict:
+    """Project a dict, a result row or an ORM object on `fields`"""
+    if isinstance(item, dict):
+        return {field: item.get(field) for field in fields}
+    return {field: getattr(item, field, None) for field in fields}
+
+
+def to_records(value: Any, fields: Sequence[str]) -> Any:
+    """
+    Project a record, a list of records or a page ({items, next_cursor})
+    on `fields`, ready for `dumps`.
+    """
+    if isinstance(value, (list, tuple)):
+        return [to_record(item, fields) for item in value]
+    if hasattr(value, "items") and hasattr(value, "next_cursor"):
+        return {
+            "items": [to_record(item, fields) for item in value.items],
+            "next_cursor": value.next_cursor,
+        }
+    return to_record(value, fields)
+
+
+class JSONBytesResponse(Response):
+    """
+    JSON response for trusted output: the content is encoded as is, without
+    the response model validation, or sent untouched when it already is bytes.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
@@ -1,21 +1,30 @@
 """session.py"""
 
-from fastapi import Request
+from secrets import compare_digest
+from typing import Optional
+from fastapi import HTTPException, Request
+from api.config import ADMIN_USER_IDS, METRICS_TOKEN
+from api.models.users import SessionUser
 
 
 class SessionManager:
     """Session manager for FastAPI."""
-    def __init__(self, user_id: int = None, session_id: str = None):
+    def __init__(
+        self, user_id: int = None, session_id: str = None, user: Optional[SessionUser] = None
+    ):
         self.user_id = user_id
         self.session_id = session_id
+        self.user = user
 
     @classmethod
     async def get_session_id(cls, request: Request):
         """Get session id from session object."""
         session = getattr(request, "session", {})
+        user = session.get("user")
         return cls(
             user_id=session.get("id"),
-            session_id=session.get("session_id")
+            session_id=session.get("session_id"),
+            user=SessionUser(**user) if user else None
         )
 
 
@@ -37,3 +46,26 @@ async def clear_session(request: Request):
     """Clear session data from session manager."""
     if hasattr(request, "session"):
         request.session.clear()
+
+def is_admin(session: dict) -> bool:
+    """Check if the user logged in a session is listed in ADMIN_USER_IDS."""
+    return session.get("id") in ADMIN_USER_IDS
+
+def has_metrics_token(request: Request) -> bool:
+    """Check if a request carries the METRICS_TOKEN bearer token (never when it is unset)."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return bool(METRICS_TOKEN) and scheme.lower() == "bearer" \
+        and compare_digest(token.encode(), METRICS_TOKEN.encode())
+
+async def require_admin(request: Request):
+    """
+    Dependency rejecting the requests of anonymous (401) and non admin (403)
+    users, unless they carry the METRICS_TOKEN bearer token.
+    """
+    if has_metrics_token(request):
+        return
+    session = getattr(request, "session", {})
+    if session.get("id") is None:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    if not is_admin(session):
+        raise HTTPException(status_code=403, detail="Admin access required")
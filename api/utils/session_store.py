@@ -0,0 +1,249 @@
+"""session_store.py"""
+
+import sqlite3
+from os import makedirs, path
+from threading import Lock
+from time import time
+from typing import Optional
+from anyio import to_thread
+from api.config import SESSION_BACKEND, SESSION_STORE_PATH, SESSION_TTL, SESSION_SHARDS
+from api.utils.serialization import dumps, loads
+
+# seconds between two sweeps of expired sessions
+SWEEP_INTERVAL = 60.0
+
+
+class MemorySessionStore():
+    """
+    Session data by session key in `shards` dicts, with an index of the
+    session keys of each user so all of them can be revoked at once.
+
+    Expired sessions are dropped when read, and swept one shard at a time
+    while sessions are saved, so a sweep never walks the whole store.
+    Sessions live in the process: use the sqlite store with several workers.
+    """
+    def __init__(self, ttl: int = SESSION_TTL, shards: int = SESSION_SHARDS):
+        self.ttl = ttl
+        self.shards: list[dict[str, tuple[float, dict]]] = [{} for _ in range(max(shards, 1))]
+        self.users: list[dict[int, set[str]]] = [{} for _ in self.shards]
+        self.sweep_index = 0
+        self.next_sweep = time() + SWEEP_INTERVAL
+        self.expirations = 0
+        self.revocations = 0
+
+    def shard(self, key: str) -> int:
+        """Index of the shard holding a session key"""
+        return hash(key) % len(self.shards)
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Return the data of a live session or None"""
+        index = self.shard(key)
+        entry = self.shards[index].get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time():
+            self.remove(index, key)
+            self.expirations += 1
+            return None
+        return dict(entry[1])
+
+    async def set(self, key: str, data: dict):
+        """Save the data of a session, restarting its ttl"""
+        index = self.shard(key)
+        self.remove(index, key)
+        self.shards[index][key] = (time() + self.ttl, dict(data))
+        if data.get("id") is not None:
+            self.users[index].setdefault(data["id"], set()).add(key)
+        if time() >= self.next_sweep:
+            self.sweep()
+
+    async def delete(self, key: str):
+        """Drop a session"""
+        self.remove(self.shard(key), key)
+
+    def remove(self, index: int, key: str):
+        """Drop a session from its shard and from the user index"""
+        entry = self.shards[index].pop(key, None)
+        if entry is None or entry[1].get("id") is None:
+            return
+        keys = self.users[index].get(entry[1]["id"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.users[index][entry[1]["id"]]
+
+    def sweep(self) -> int:
+        """Drop the expired sessions of the next shard, return how many"""
+        index = self.sweep_index
+        now = time()
+        expired = [key for key, (expires_at, _) in self.shards[index].items() if expires_at <= now]
+        for key in expired:
+            self.remove(index, key)
+        self.expirations += len(expired)
+        self.sweep_index = (index + 1) % len(self.shards)
+        self.next_sweep = now + SWEEP_INTERVAL
+        return len(expired)
+
+    async def revoke_user(self, user_id: int) -> int:
+        """Drop every session of a user, return how many"""
+        count = 0
+        for index, users in enumerate(self.users):
+            for key in list(users.get(user_id, ())):
+                self.remove(index, key)
+                count += 1
+        self.revocations += count
+        return count
+
+    async def update_user(self, user_id: int, values: dict) -> int:
+        """Merge `values` into every session of a user, keeping their expiry"""
+        count = 0
+        for index, users in enumerate(self.users):
+            for key in users.get(user_id, ()):
+                expires_at, data = self.shards[index][key]
+                self.shards[index][key] = (expires_at, {**data, **values})
+                count += 1
+        return count
+
+    def stats(self) -> dict:
+        """Return the session counts and counters"""
+        return {
+            "backend": "memory",
+            "ttl": self.ttl,
+            "sessions": sum(len(shard) for shard in self.shards),
+            "users": len(set().union(*self.users)),
+            "shards": len(self.shards),
+            "expirations": self.expirations,
+            "revocations": self.revocations,
+        }
+
+    def close(self):
+        """Nothing to release, the sessions end with the process"""
+
+
+class SQLiteSessionStore():
+    """
+    Session data in a SQLite file, shared by the workers of one host.
+
+    Queries run in worker threads on a single connection in WAL mode, so
+    readers in the other processes are not blocked by a write.
+    """
+    def __init__(self, location: str = SESSION_STORE_PATH, ttl: int = SESSION_TTL):
+        self.location = location
+        self.ttl = ttl
+        self.lock = Lock()
+        self.connection: Optional[sqlite3.Connection] = None
+        self.next_sweep = time() + SWEEP_INTERVAL
+        self.expirations = 0
+        self.revocations = 0
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the database and create the table on first use"""
+        if self.connection is None:
+            if path.dirname(self.location):
+                makedirs(path.dirname(self.location), exist_ok=True)
+            connection = sqlite3.connect(
+                self.location, timeout=10, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "key TEXT PRIMARY KEY, user_id INTEGER, data BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_sessions_user_id ON sessions (user_id)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)"
+            )
+            self.connection = connection
+        return self.connection
+
+    def execute(self, query: str, params: tuple = ()) -> tuple[list, int]:
+        """Run a query on the shared connection, return (rows, rowcount) (blocking)"""
+        with self.lock:
+            cursor = self.connect().execute(query, params)
+            return cursor.fetchall(), cursor.rowcount
+
+    async def run(self, query: str, params: tuple = ()) -> tuple[list, int]:
+        """Run a query in a worker thread"""
+        return await to_thread.run_sync(self.execute, query, params)
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Return the data of a live session or None"""
+        rows, _ = await self.run(
+            "SELECT data FROM sessions WHERE key = ? AND expires_at > ?", (key, time())
+        )
+        return loads(rows[0][0]) if rows else None
+
+    async def set(self, key: str, data: dict):
+        """Save the data of a session, restarting its ttl"""
+        await self.run(
+            "INSERT OR REPLACE INTO sessions (key, user_id, data, expires_at) VALUES (?, ?, ?, ?)",
+            (key, data.get("id"), dumps(data), time() + self.ttl)
+        )
+        if time() >= self.next_sweep:
+            await self.sweep()
+
+    async def delete(self, key: str):
+        """Drop a session"""
+        await self.run("DELETE FROM sessions WHERE key = ?", (key,))
+
+    async def sweep(self) -> int:
+        """Drop the expired sessions, return how many"""
+        self.next_sweep = time() + SWEEP_INTERVAL
+        _, count = await self.run("DELETE FROM sessions WHERE expires_at <= ?", (time(),))
+        self.expirations += count
+        return count
+
+    async def revoke_user(self, user_id: int) -> int:
+        """Drop every session of a user, return how many"""
+        _, count = await self.run("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        self.revocations += count
+        return count
+
+    async def update_user(self, user_id: int, values: dict) -> int:
+        """Merge `values` into every session of a user, keeping their expiry"""
+        rows, _ = await self.run(
+            "SELECT key, data FROM sessions WHERE user_id = ? AND expires_at > ?", (user_id, time())
+        )
+        for key, data in rows:
+            await self.run(
+                "UPDATE sessions SET data = ? WHERE key = ?", (dumps({**loads(data), **values}), key)
+            )
+        return len(rows)
+
+    def stats(self) -> dict:
+        """Return the session counts and counters"""
+        rows, _ = self.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT user_id) FROM sessions WHERE expires_at > ?", (time(),)
+        )
+        sessions, users = rows[0]
+        return {
+            "backend": "sqlite",
+            "location": self.location,
+            "ttl": self.ttl,
+            "sessions": sessions,
+            "users": users,
+            "expirations": self.expirations,
+            "revocations": self.revocations,
+        }
+
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+def create_store(name: str = SESSION_BACKEND):
+    """Create the configured session store"""
+    match name:
+        case "memory":
+            return MemorySessionStore()
+        case "sqlite":
+            return SQLiteSessionStore()
+        case _:
+            raise ValueError(f"Unknown session backend: {name}")
+
+
+session_store = create_store()
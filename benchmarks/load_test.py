@@ -0,0 +1,354 @@
+"""
+HTTP load test of the API, in process.
+
+Boots `api.app` through httpx's ASGITransport against a throwaway SQLite
+database (or the database given with --database-url, e.g. a scratch MySQL
+schema), seeds N users and M notes, then drives a weighted mix of reads,
+writes and searches on /api/notes and /api/users at each concurrency level.
+Throughput and p50/p95/p99 latencies are written as JSON; with --baseline
+the run is compared to an earlier report and exits with 1 on a regression.
+
+Run from the repository root:
+    python benchmarks/load_test.py --users 50 --notes 5000 --concurrency 1,8,32 \\
+        --requests 2000 --output after.json --baseline before.json
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from os import chdir, environ, path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = "bench-password"
+WORDS = (
+    "alpha", "budget", "meeting", "travel", "recipe", "garden", "python", "invoice",
+    "project", "review", "shopping", "holiday", "fitness", "reading", "music", "design",
+)
+# operation -> workload it belongs to
+OPERATIONS = {
+    "list_user_notes": "read",
+    "get_note": "read",
+    "list_notes": "read",
+    "get_user": "read",
+    "create_note": "write",
+    "update_note": "write",
+    "search_title": "search",
+    "search_content": "search",
+}
+
+
+def parse_args() -> argparse.Namespace:
+    """Command line options"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--users", type=int, default=50, help="users to seed")
+    parser.add_argument("--notes", type=int, default=2000, help="notes to seed")
+    parser.add_argument(
+        "--concurrency", default="1,8,32", help="comma separated concurrency levels"
+    )
+    parser.add_argument("--requests", type=int, default=1000, help="requests per level")
+    parser.add_argument(
+        "--mix", default="read=70,write=10,search=20", help="weights of the workloads"
+    )
+    parser.add_argument("--seed", type=int, default=2024, help="random seed")
+    parser.add_argument(
+        "--database-url", help="async database URL, a temporary SQLite file by default"
+    )
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.10,
+        help="allowed relative slowdown against the baseline (default 10%%)"
+    )
+    return parser.parse_args()
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """Weights of each operation from "read=70,write=10,search=20" """
+    workloads = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        workloads[name.strip()] = float(weight)
+    unknown = set(workloads) - set(OPERATIONS.values())
+    if unknown:
+        raise SystemExit(f"Unknown workloads in --mix: {', '.join(sorted(unknown))}")
+    weights = {}
+    for operation, workload in OPERATIONS.items():
+        share = sum(1 for other in OPERATIONS.values() if other == workload)
+        weights[operation] = workloads.get(workload, 0.0) / share
+    return weights
+
+
+def percentile(values: list[float], rank: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, round(rank / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def summarize(latencies: list[float]) -> dict:
+    """Latency percentiles in milliseconds"""
+    values = sorted(latency * 1000 for latency in latencies)
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+        "max": round(values[-1], 3) if values else 0.0,
+    }
+
+
+def git_commit() -> str | None:
+    """Short hash of the checked out commit, to tell the reports apart"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+            text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def seed(users: int, notes: int, rng: Random):
+    """Insert the synthetic users and notes in bulk"""
+    # pylint: disable=import-outside-toplevel
+    from sqlalchemy import insert
+    from api.database import SessionLocal, UserDb, NoteDb
+    from api.utils.passwords import password_hasher
+
+    hashed_password = await password_hasher.hash(PASSWORD)
+    start = datetime(2024, 1, 1)
+    async with SessionLocal() as sess:
+        await sess.execute(insert(UserDb), [
+            {
+                "username": f"user{i}",
+                "email": f"user{i}@bench.com",
+                "hashed_password": hashed_password,
+                "session_id": f"bench-session-{i}",
+            }
+            for i in range(1, users + 1)
+        ])
+        for offset in range(0, notes, 1000):
+            await sess.execute(insert(NoteDb), [
+                {
+                    "user_id": rng.randint(1, users),
+                    "title": " ".join(rng.choices(WORDS, k=3)),
+                    "content": " ".join(rng.choices(WORDS, k=rng.randint(20, 120))),
+                    "time_created": start + timedelta(minutes=i),
+                    "time_edition": start + timedelta(minutes=i),
+                }
+                for i in range(offset, min(offset + 1000, notes))
+            ])
+        await sess.commit()
+
+
+class Worker():
+    """A logged in client sending the operations of the mix"""
+    def __init__(self, client, args: argparse.Namespace, rng: Random):
+        self.client = client
+        self.args = args
+        self.rng = rng
+
+    def request(self, operation: str):
+        """The request of an operation"""
+        rng, args = self.rng, self.args
+        match operation:
+            case "list_user_notes":
+                return self.client.get(
+                    "/api/notes/user_id", params={"user_id": rng.randint(1, args.users), "cursor": ""}
+                )
+            case "get_note":
+                return self.client.get(
+                    "/api/notes/id", params={"note_id": rng.randint(1, args.notes)}
+                )
+            case "list_notes":
+                return self.client.get(
+                    "/api/notes/list", params={"cursor": "", "limit": 20, "view": "summary"}
+                )
+            case "get_user":
+                return self.client.get(
+                    "/api/users/id", params={"user_id": rng.randint(1, args.users)}
+                )
+            case "create_note":
+                return self.client.post("/api/notes/create", json={
+                    "title": " ".join(rng.choices(WORDS, k=3)),
+                    "content": " ".join(rng.choices(WORDS, k=40)),
+                })
+            case "update_note":
+                return self.client.put(
+                    f"/api/notes/{rng.randint(1, args.notes)}/update",
+                    json={"content": " ".join(rng.choices(WORDS, k=40))}
+                )
+            case "search_title":
+                return self.client.get(
+                    "/api/notes/title", params={"query": rng.choice(WORDS), "limit": 20}
+                )
+            case _:
+                return self.client.get(
+                    "/api/notes/content", params={"query": rng.choice(WORDS), "limit": 20}
+                )
+
+    async def run(self, operations: list[str], results: list[tuple[str, float, int]]):
+        """Send the operations one after another, recording (operation, seconds, status)"""
+        for operation in operations:
+            started_at = perf_counter()
+            response = await self.request(operation)
+            results.append((operation, perf_counter() - started_at, response.status_code))
+
+
+async def run_level(clients: list, concurrency: int, args, weights, rng: Random) -> dict:
+    """Run `args.requests` operations spread over `concurrency` workers"""
+    operations = rng.choices(list(weights), weights=list(weights.values()), k=args.requests)
+    workers = [
+        Worker(clients[i], args, Random(rng.random()))
+        for i in range(concurrency)
+    ]
+    results: list[tuple[str, float, int]] = []
+    started_at = perf_counter()
+    await asyncio.gather(*(
+        worker.run(operations[i::concurrency], results) for i, worker in enumerate(workers)
+    ))
+    elapsed = perf_counter() - started_at
+
+    by_operation: dict[str, list[tuple[float, int]]] = {}
+    for operation, latency, status in results:
+        by_operation.setdefault(operation, []).append((latency, status))
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 1),
+        "errors": sum(1 for _, _, status in results if status >= 400),
+        "latency_ms": summarize([latency for _, latency, _ in results]),
+        "operations": {
+            operation: {
+                "requests": len(samples),
+                "errors": sum(1 for _, status in samples if status >= 400),
+                "latency_ms": summarize([latency for latency, _ in samples]),
+            }
+            for operation, samples in sorted(by_operation.items())
+        },
+    }
+
+
+async def benchmark(args: argparse.Namespace) -> dict:
+    """Boot the app, seed it and run every concurrency level"""
+    # pylint: disable=import-outside-toplevel
+    import httpx
+    from api import app, note_model
+    from api.config import SEARCH_ENGINE, DATABASE_URL
+
+    rng = Random(args.seed)
+    weights = parse_mix(args.mix)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    async with app.router.lifespan_context(app):
+        await seed(args.users, args.notes, rng)
+        if SEARCH_ENGINE == "memory":
+            await note_model.build_search_index()
+
+        transport = httpx.ASGITransport(app=app)
+        clients = []
+        try:
+            for i in range(max(levels)):
+                client = httpx.AsyncClient(transport=transport, base_url="http://bench")
+                response = await client.post(
+                    "/api/users/login", data={"username": f"user{i % args.users + 1}", "password": PASSWORD}
+                )
+                if response.status_code != 302:
+                    raise SystemExit(f"Login failed: {response.status_code} {response.text[:200]}")
+                clients.append(client)
+
+            results = []
+            for concurrency in levels:
+                result = await run_level(clients, concurrency, args, weights, rng)
+                print(
+                    f"concurrency {concurrency:>4}: {result['throughput_rps']:>8} req/s  "
+                    f"p50 {result['latency_ms']['p50']} ms  p95 {result['latency_ms']['p95']} ms  "
+                    f"p99 {result['latency_ms']['p99']} ms  errors {result['errors']}",
+                    file=sys.stderr
+                )
+                results.append(result)
+        finally:
+            for client in clients:
+                await client.aclose()
+
+    return {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "users": args.users,
+            "notes": args.notes,
+            "requests": args.requests,
+            "mix": args.mix,
+            "seed": args.seed,
+            "database": DATABASE_URL.split("://", 1)[0],
+            "search_engine": SEARCH_ENGINE,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions of a report against a baseline, at the same concurrency levels"""
+    regressions = []
+    previous = {result["concurrency"]: result for result in baseline.get("results", [])}
+    for result in report["results"]:
+        before = previous.get(result["concurrency"])
+        if before is None:
+            continue
+        level = f"concurrency {result['concurrency']}"
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{level}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s"
+            )
+        for rank in ("p95", "p99"):
+            if result["latency_ms"][rank] > before["latency_ms"][rank] * (1 + tolerance):
+                regressions.append(
+                    f"{level}: {rank} {before['latency_ms'][rank]} -> {result['latency_ms'][rank]} ms"
+                )
+    return regressions
+
+
+def main():
+    """Run the load test and print or write the JSON report"""
+    args = parse_args()
+    chdir(ROOT)
+    with TemporaryDirectory(prefix="note-web-bench-") as scratch:
+        # settings are read when the api package is imported
+        environ["DATABASE_URL"] = args.database_url or \
+            f"sqlite+aiosqlite:///{path.join(scratch, 'bench.sqlite3')}"
+        environ.setdefault("STATIC_BUILD_DIR", path.join(scratch, "static"))
+        environ.setdefault("TEMPLATE_BYTECODE_DIR", path.join(scratch, "jinja"))
+        environ.setdefault("SESSION_BACKEND", "memory")
+        # the app prints its startup messages, keep stdout for the report
+        with redirect_stdout(sys.stderr):
+            report = asyncio.run(benchmark(args))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
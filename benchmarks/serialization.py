@@ -0,0 +1,69 @@
+"""
+Per-item cost of encoding note responses.
+
+before: the response_model path, NoteDb objects validated into NoteDetails
+        by pydantic, then dumped by FastAPI's JSONResponse (json.dumps)
+after:  plain rows projected on NOTE_FIELDS and encoded by api.utils.serialization
+
+Run from the repository root:  python benchmarks/serialization.py [items] [repeat]
+"""
+
+import json
+import sys
+from datetime import datetime, timedelta
+from os import environ, path
+from timeit import repeat
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+# the models import the database module, any driver that is installed will do
+environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+
+# pylint: disable=wrong-import-position
+from pydantic import TypeAdapter
+from api.database import NoteDb
+from api.models.notes import NoteDetails, NOTE_FIELDS
+from api.utils.serialization import dumps, to_records, orjson
+
+
+def make_notes(count: int) -> tuple[list, list]:
+    """Build the same notes as NoteDb objects and as rows (dicts)"""
+    start = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    rows = [
+        {
+            "id": i + 1,
+            "user_id": i % 50 + 1,
+            "title": f"Note number {i}",
+            "content": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+            "time_created": start + timedelta(minutes=i),
+            "time_edition": start + timedelta(minutes=i, seconds=30),
+        }
+        for i in range(count)
+    ]
+    return [NoteDb(**row) for row in rows], rows
+
+
+def main(count: int = 1000, runs: int = 20):
+    """Print the best per-item time of each encoding path"""
+    objects, rows = make_notes(count)
+    adapter = TypeAdapter(list[NoteDetails])
+
+    def before() -> bytes:
+        notes = adapter.validate_python(objects, from_attributes=True)
+        return json.dumps(adapter.dump_python(notes, mode="json"), separators=(",", ":")).encode()
+
+    def after() -> bytes:
+        return dumps(to_records(rows, NOTE_FIELDS))
+
+    assert json.loads(before()) == json.loads(after()), "both paths must encode the same JSON"
+
+    print(f"{count} notes, best of {runs} runs, encoder: {'orjson' if orjson else 'json'}")
+    results = {}
+    for name, func in (("before", before), ("after", after)):
+        best = min(repeat(func, number=1, repeat=runs))
+        results[name] = best
+        print(f"{name:>7}: {best * 1e6 / count:8.2f} us/item  {best * 1e3:8.2f} ms/response")
+    print(f"speedup: {results['before'] / results['after']:.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
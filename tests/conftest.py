@@ -0,0 +1,71 @@
+"""conftest.py"""
+
+import os
+import sqlite3
+import sys
+from contextlib import ExitStack
+from itertools import count
+from pathlib import Path
+from tempfile import mkdtemp
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+WORK_DIR = mkdtemp(prefix="note-web-tests-")
+DATABASE = f"{WORK_DIR}/notes.sqlite3"
+
+# the settings are read when api is imported, so the environment is set first
+os.environ.update(
+    DATABASE_URL=f"sqlite+aiosqlite:///{DATABASE}",
+    STATIC_BUILD_DIR=f"{WORK_DIR}/build",
+    SEARCH_ENGINE="fulltext",
+    NOTE_CACHE_BACKEND="local",
+    SESSION_BACKEND="memory",
+    SCRYPT_N="1024",
+    ADMIN_USER_IDS="1",
+    METRICS_TOKEN="test-token",
+    QUERY_PROFILER="off",
+)
+os.chdir(ROOT)
+sys.path.insert(0, str(ROOT))
+
+from fastapi.testclient import TestClient  # pylint: disable=wrong-import-position
+from api import app  # pylint: disable=wrong-import-position
+
+usernames = (f"user{number}" for number in count(1))
+
+
+def register(client: TestClient) -> int:
+    """Register a new user, logged in on `client`, and return its id"""
+    username = next(usernames)
+    response = client.post(
+        "/api/users/register",
+        data={"username": username, "email": f"{username}@example.com", "password": "password1"},
+        follow_redirects=False
+    )
+    assert response.status_code == 302, response.text
+    with sqlite3.connect(DATABASE) as connection:
+        return connection.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+
+@pytest.fixture
+def make_client():
+    """Factory of test clients, logged in as a new user unless `anonymous`"""
+    with ExitStack() as stack:
+        def make(anonymous: bool = False) -> TestClient:
+            client = stack.enter_context(TestClient(app))
+            client.user_id = None if anonymous else register(client)
+            return client
+        yield make
+
+
+@pytest.fixture
+def client(make_client):
+    """Test client logged in as a new user"""
+    return make_client()
+
+
+def create_note(client: TestClient, title: str, content: str = "content") -> dict:
+    """Create a note of the user of `client`"""
+    response = client.post("/api/notes/create", json={"title": title, "content": content})
+    assert response.status_code == 201, response.text
+    return response.json()
@@ -0,0 +1,64 @@
+"""test_batch.py"""
+
+from conftest import create_note
+
+
+def apply(client, *operations, atomic: bool = False):
+    """Post a batch and return its result"""
+    response = client.post(
+        "/api/notes/batch", json={"operations": list(operations), "atomic": atomic}
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_creates_get_their_ids_in_order(client):
+    result = apply(
+        client,
+        {"op": "create", "title": "first", "content": "one"},
+        {"op": "create", "title": "second", "content": "two"},
+    )
+
+    assert result["applied"] == 2 and result["failed"] == 0
+    for item, title in zip(result["results"], ("first", "second")):
+        note = client.get("/api/notes/id", params={"note_id": item["id"]}).json()
+        assert note["title"] == title
+
+
+def test_one_invalid_item_fails_alone(client):
+    note = create_note(client, "before")
+
+    result = apply(
+        client,
+        {"op": "create", "title": "x" * 101, "content": "too long"},
+        {"op": "update", "id": note["id"], "title": "after"},
+        {"op": "delete", "id": 10 ** 9},
+        {"op": "create"},
+    )
+
+    statuses = [(item["status"], item["code"]) for item in result["results"]]
+    assert statuses == [("error", 400), ("ok", None), ("error", 404), ("error", 400)]
+    assert result["applied"] == 1
+    assert client.get("/api/notes/id", params={"note_id": note["id"]}).json()["title"] == "after"
+
+
+def test_notes_of_other_users_are_forbidden(make_client):
+    owner, other = make_client(), make_client()
+    note = create_note(owner, "mine")
+
+    result = apply(other, {"op": "delete", "id": note["id"]})
+
+    assert result["results"][0]["code"] == 403
+    assert owner.get("/api/notes/id", params={"note_id": note["id"]}).status_code == 200
+
+
+def test_atomic_batch_applies_nothing_on_failure(client):
+    result = apply(
+        client,
+        {"op": "create", "title": "skipped", "content": "c"},
+        {"op": "update", "id": 10 ** 9, "title": "missing"},
+        atomic=True,
+    )
+
+    assert result["applied"] == 0
+    assert [item["status"] for item in result["results"]] == ["skipped", "error"]
@@ -0,0 +1,63 @@
+"""test_compression.py"""
+
+import asyncio
+from api.middleware.compression import CompressionMiddleware
+
+BODY = b"compressible text " * 200
+
+
+def run(*messages, headers: tuple = ()) -> list:
+    """Send `messages` from an app through the middleware and return what reaches the server"""
+    start = {
+        "type": "http.response.start", "status": 200,
+        "headers": [(b"content-type", b"text/plain"), *headers],
+    }
+
+    async def app(scope, receive, send):
+        await send(start)
+        for message in messages:
+            await send(message)
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", b"gzip")],
+    }
+    asyncio.run(CompressionMiddleware(app, minimum_size=16)(scope, receive, send))
+    return sent
+
+
+def header(message: dict, name: bytes):
+    """Value of a response header, None if missing"""
+    return next((value for key, value in message["headers"] if key == name), None)
+
+
+def test_body_is_compressed():
+    start, body = run({"type": "http.response.body", "body": BODY})
+
+    assert header(start, b"content-encoding") == b"gzip"
+    assert len(body["body"]) < len(BODY)
+
+
+def test_start_is_sent_before_other_messages():
+    pathsend = {"type": "http.response.pathsend", "path": "/tmp/file.txt"}
+
+    sent = run(pathsend)
+
+    assert [message["type"] for message in sent] == ["http.response.start", "http.response.pathsend"]
+    assert header(sent[0], b"content-encoding") is None
+
+
+def test_no_transform_is_not_compressed():
+    body = {"type": "http.response.body", "body": BODY}
+
+    start, sent = run(body, headers=((b"cache-control", b"public, no-transform"),))
+
+    assert header(start, b"content-encoding") is None
+    assert sent["body"] == BODY
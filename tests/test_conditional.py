@@ -0,0 +1,56 @@
+"""test_conditional.py"""
+
+from conftest import create_note
+
+
+def test_note_is_not_modified_for_its_etag_and_date(client):
+    note = create_note(client, "cached")
+    response = client.get("/api/notes/id", params={"note_id": note["id"]})
+    etag, last_modified = response.headers["ETag"], response.headers["Last-Modified"]
+
+    by_etag = client.get(
+        "/api/notes/id", params={"note_id": note["id"]}, headers={"If-None-Match": etag}
+    )
+    by_date = client.get(
+        "/api/notes/id", params={"note_id": note["id"]},
+        headers={"If-Modified-Since": last_modified}
+    )
+
+    assert by_etag.status_code == 304
+    assert by_etag.headers["ETag"] == etag
+    assert by_date.status_code == 304
+
+
+def test_update_changes_the_note_etag(client):
+    note = create_note(client, "edited")
+    etag = client.get("/api/notes/id", params={"note_id": note["id"]}).headers["ETag"]
+
+    client.put(f"/api/notes/{note['id']}/update", json={"title": "edited", "content": "new"})
+    response = client.get(
+        "/api/notes/id", params={"note_id": note["id"]}, headers={"If-None-Match": etag}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["content"] == "new"
+    assert response.headers["ETag"] != etag
+
+
+def test_list_has_no_last_modified_and_changes_etag_on_delete(client):
+    create_note(client, "kept")
+    deleted = create_note(client, "deleted")
+    params = {"user_id": client.user_id}
+    response = client.get("/api/notes/user_id", params=params)
+    assert "Last-Modified" not in response.headers
+    etag = response.headers["ETag"]
+
+    assert client.delete(f"/api/notes/{deleted['id']}/delete").status_code == 200
+    by_etag = client.get("/api/notes/user_id", params=params, headers={"If-None-Match": etag})
+    by_date = client.get(
+        "/api/notes/user_id", params=params,
+        headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+    )
+
+    assert by_etag.status_code == 200
+    assert by_etag.headers["ETag"] != etag
+    assert by_date.status_code == 200
+    assert [note["title"] for note in by_date.json()] == ["kept"]
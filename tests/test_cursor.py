@@ -0,0 +1,55 @@
+"""test_cursor.py"""
+
+import pytest
+from conftest import create_note
+from api.utils.helpers import encode_cursor
+
+
+def pages(client, **params):
+    """Every page of a cursor listing, following next_cursor"""
+    cursor = ""
+    while cursor is not None:
+        response = client.get("/api/notes/user_id", params={**params, "cursor": cursor})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        yield body["items"]
+        cursor = body["next_cursor"]
+
+
+def test_cursor_pages_cover_every_note_once_newest_first(client):
+    created = [create_note(client, f"note {i}")["id"] for i in range(5)]
+
+    ids = [note["id"] for page in pages(client, user_id=client.user_id, limit=2)
+           for note in page]
+
+    assert ids == created[::-1]
+
+
+def test_edited_note_moves_to_the_first_page(client):
+    first, _ = create_note(client, "old"), create_note(client, "new")
+    client.put(f"/api/notes/{first['id']}/update", json={"title": "old", "content": "edited"})
+
+    page = next(pages(client, user_id=client.user_id, limit=1))
+
+    assert [note["id"] for note in page] == [first["id"]]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not a cursor",
+    encode_cursor([{"a": 1}, 2]),
+    encode_cursor(["2024-01-01T00:00:00", "2"]),
+    encode_cursor(["yesterday", 2]),
+    encode_cursor([1]),
+])
+def test_malformed_cursor_is_a_bad_request(client, cursor):
+    response = client.get(
+        "/api/notes/user_id", params={"user_id": client.user_id, "cursor": cursor}
+    )
+
+    assert response.status_code == 400
+
+
+def test_malformed_list_cursor_is_a_bad_request(client):
+    response = client.get("/api/notes/list", params={"cursor": encode_cursor([True])})
+
+    assert response.status_code == 400
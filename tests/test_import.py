@@ -0,0 +1,41 @@
+"""test_import.py"""
+
+from api.config import IMPORT_MAX_RECORD_LENGTH
+
+
+def import_csv(client, body: str):
+    """Post a CSV import and return its result"""
+    response = client.post(
+        "/api/notes/import", params={"format": "csv"}, content=body.encode()
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_rows_are_imported(client):
+    result = import_csv(client, 'title,content\nfirst,"one\ntwo"\nsecond,two\n')
+
+    assert result["inserted"] == 2 and result["failed"] == 0
+
+
+def test_unterminated_quote_is_a_row_error(client):
+    padding = ("x" * 1000 + "\n") * (IMPORT_MAX_RECORD_LENGTH // 1000 + 1)
+    body = f'title,content\nfirst,one\nsecond,"unterminated\n{padding}third,three\n'
+
+    result = import_csv(client, body)
+
+    assert result["inserted"] == 1
+    assert result["failed"] == 1
+    assert result["errors"][0]["row"] == 2
+    assert "longer than" in result["errors"][0]["error"]
+
+
+def test_line_without_newline_is_a_row_error(client):
+    body = '{"title": "first", "content": "one"}\n' + "x" * (IMPORT_MAX_RECORD_LENGTH + 1)
+    response = client.post("/api/notes/import", content=body.encode())
+    result = response.json()
+
+    assert result["inserted"] == 1
+    assert result["errors"] == [
+        {"row": 2, "error": f"Line is longer than {IMPORT_MAX_RECORD_LENGTH} characters"}
+    ]
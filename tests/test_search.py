@@ -0,0 +1,32 @@
+"""test_search.py"""
+
+from conftest import create_note
+
+
+def note_ids(body) -> list[int]:
+    """Ids of a search result, a single match is returned as the note itself"""
+    return [body["id"]] if isinstance(body, dict) else [note["id"] for note in body]
+
+
+def test_title_search_matches_every_term_in_the_title(client):
+    only_title = create_note(client, "alpha", "beta")
+    both = create_note(client, "alpha beta", "gamma")
+
+    response = client.get(
+        "/api/notes/title", params={"query": "alpha beta", "user_id": client.user_id}
+    )
+
+    assert response.status_code == 200, response.text
+    ids = note_ids(response.json())
+    assert both["id"] in ids
+    assert only_title["id"] not in ids
+
+
+def test_content_term_is_not_matched_by_a_title_search(client):
+    create_note(client, "delta", "epsilon")
+
+    response = client.get(
+        "/api/notes/title", params={"query": "delta epsilon", "user_id": client.user_id}
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,22 @@
+"""test_status.py"""
+
+import pytest
+
+ENDPOINTS = [
+    "/metrics", "/status/db-pool", "/status/session-cache", "/status/sessions",
+    "/status/note-cache", "/status/compression", "/status/page-cache",
+    "/status/password-hasher", "/status/query-profiles",
+]
+
+
+@pytest.mark.parametrize("path", ENDPOINTS)
+def test_status_needs_a_login(make_client, path):
+    assert make_client(anonymous=True).get(path).status_code == 401
+
+
+@pytest.mark.parametrize("path", ENDPOINTS)
+def test_status_accepts_the_metrics_token(make_client, path):
+    client = make_client(anonymous=True)
+
+    assert client.get(path, headers={"Authorization": "Bearer test-token"}).status_code == 200
+    assert client.get(path, headers={"Authorization": "Bearer wrong"}).status_code == 401